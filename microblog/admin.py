@@ -39,8 +39,12 @@ class PostAdmin(admin.ModelAdmin):
     list_display = ('headline', 'date', 'author', 'status')
     ordering = ('-date',)
 
+    def queryset(self, request):
+        # headline ha bisogno dei PostContent di ogni post della changelist
+        return super(PostAdmin, self).queryset(request).with_contents()
+
     def headline(self, obj):
-        contents = dict((c.language, c) for c in obj.postcontent_set.all())
+        contents = obj.contents()
         for l, lname in settings.LANGUAGES:
             try:
                 content = contents[l]
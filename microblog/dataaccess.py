@@ -1,21 +1,240 @@
 # -*- coding: UTF-8 -*-
 
 from django.core.cache import cache
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
+from collections import OrderedDict
+import cPickle as pickle
 import functools
 import hashlib
+import random
+import threading
+import time
 
-WEEK = 7 * 24 * 60 * 60 # 1 week
-def cache_me(key=None, ikey=None, signals=(), models=(), timeout=WEEK):
-    def hashme(k):
-        if isinstance(k, unicode):
-            k = k.encode('utf-8')
-        return hashlib.md5(k).hexdigest()
+from microblog import settings
+from microblog import stats as _stats
+
+class LocalCache(object):
+    """
+    Cache LRU in memoria di processo da affiancare alla cache di django; le
+    entry sono limitate sia in numero che in dimensione (approssimata con la
+    lunghezza della loro versione serializzata) e scadono dopo `timeout`
+    secondi.
+    """
+    def __init__(self, max_entries, max_size, timeout):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.timeout = timeout
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k):
+        with self._lock:
+            try:
+                expire, size, value = self._data.pop(k)
+            except KeyError:
+                return None
+            if expire < time.time():
+                self.size -= size
+                return None
+            # la reinserisco in coda, così le entry più vecchie sono sempre
+            # all'inizio del dizionario
+            self._data[k] = (expire, size, value)
+            return value
+
+    def set(self, k, value):
+        try:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError):
+            return
+        if size > self.max_size:
+            return
+        with self._lock:
+            self._pop(k)
+            self._data[k] = (time.time() + self.timeout, size, value)
+            self.size += size
+            while len(self._data) > self.max_entries or self.size > self.max_size:
+                _, (_, size, _) = self._data.popitem(last=False)
+                self.size -= size
+
+    def delete_many(self, ks):
+        with self._lock:
+            for k in ks:
+                self._pop(k)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, k):
+        try:
+            _, size, _ = self._data.pop(k)
+        except KeyError:
+            pass
+        else:
+            self.size -= size
+
+if settings.MICROBLOG_LOCAL_CACHE_ENTRIES:
+    local_cache = LocalCache(
+        settings.MICROBLOG_LOCAL_CACHE_ENTRIES,
+        settings.MICROBLOG_LOCAL_CACHE_SIZE,
+        settings.MICROBLOG_LOCAL_CACHE_TIMEOUT)
+else:
+    local_cache = None
+
+stats = _stats.get_sink()
+# nomi delle funzioni decorate con cache_me, usati per leggere le statistiche
+cached_functions = []
+
+def _record(name, metric, value=1):
+    if stats is not None:
+        stats.record(name, metric, value)
+
+def _record_size(name, data):
+    # misurare la dimensione richiede di serializzare di nuovo il valore,
+    # viene fatto solo per una frazione dei miss e il risultato è scalato
+    # in modo che bytes / miss stimi ancora la dimensione media
+    rate = settings.MICROBLOG_CACHE_STATS_SIZE_SAMPLE
+    if stats is None or not rate or random.random() >= rate:
+        return
+    try:
+        size = len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError):
+        return
+    _record(name, 'bytes', int(size / rate))
+
+_staleness = threading.local()
+
+class track_staleness(object):
+    """
+    Context manager che tiene traccia dei valori potenzialmente non
+    aggiornati restituiti da cache_me all'interno del blocco:
+
+        with track_staleness() as t:
+            data = derived(post_list(lang))
+        cache.set(k, data, min(timeout, t.window) if t.window else timeout)
+
+    Al termine `t.window` contiene il numero massimo di secondi per cui
+    quei valori possono essere non aggiornati (0 se sono tutti freschi):
+    la copia "stale" servita mentre un altro processo ricalcola il valore
+    (MICROBLOG_CACHE_LOCK_TIMEOUT) o un valore, o una generazione, letti
+    dalla cache locale (MICROBLOG_LOCAL_CACHE_TIMEOUT). Chi mette in cache
+    dati derivati non deve conservarli più a lungo.
+    """
+    def __enter__(self):
+        self.outer = getattr(_staleness, 'window', None)
+        _staleness.window = 0
+        self.window = 0
+        return self
+
+    def __exit__(self, *exc):
+        self.window = _staleness.window
+        if self.outer is None:
+            del _staleness.window
+        else:
+            _staleness.window = max(self.outer, self.window)
+        return False
+
+def _mark_stale(seconds):
+    window = getattr(_staleness, 'window', None)
+    if window is not None and seconds > window:
+        _staleness.window = seconds
+
+def hashme(k):
+    if isinstance(k, unicode):
+        k = k.encode('utf-8')
+    return hashlib.md5(k).hexdigest()
+
+DAY = 24 * 60 * 60 # 1 day
+WEEK = 7 * DAY # 1 week
+# i contatori delle generazioni devono sopravvivere ai dati che
+# identificano; 30 giorni è il massimo timeout relativo di memcached
+GENERATION_TIMEOUT = 30 * DAY
+
+def _genkey(ns):
+    return 'g:' + hashme(ns)
+
+def _new_generation():
+    # se un contatore sparisce dalla cache non posso ripartire da 1, potrei
+    # resuscitare dati invalidati; il timestamp in millisecondi è sempre
+    # maggiore di qualsiasi valore precedente
+    return int(time.time() * 1000)
+
+def generations(nss):
+    """
+    Restituisce un dizionario namespace -> generazione corrente.
+    """
+    output = {}
+    if local_cache is not None:
+        for ns in nss:
+            g = local_cache.get(_genkey(ns))
+            if g is not None:
+                output[ns] = g
+                _mark_stale(settings.MICROBLOG_LOCAL_CACHE_TIMEOUT)
+    gkeys = dict((_genkey(ns), ns) for ns in nss if ns not in output)
+    if gkeys:
+        found = cache.get_many(gkeys.keys())
+        for gk, ns in gkeys.items():
+            try:
+                g = found[gk]
+            except KeyError:
+                g = _new_generation()
+                if not cache.add(gk, g, GENERATION_TIMEOUT):
+                    g = cache.get(gk) or g
+            output[ns] = g
+            if local_cache is not None:
+                local_cache.set(gk, g)
+    return output
+
+def invalidate_namespaces(nss):
+    """
+    Invalida tutte le chiavi appartenenti ai namespace passati incrementando
+    il loro contatore di generazione.
+    """
+    for ns in nss:
+        gk = _genkey(ns)
+        try:
+            g = cache.incr(gk)
+        except ValueError:
+            g = _new_generation()
+            cache.set(gk, g, GENERATION_TIMEOUT)
+        if local_cache is not None:
+            local_cache.set(gk, g)
+
+def cache_me(key=None, ikey=None, signals=(), models=(), timeout=WEEK, local=True, lock=False, soft_timeout=None, ns=None):
+    """
+    Decoratore che memorizza nella cache di django il risultato di `f`.
+
+    Se la cache locale è abilitata (MICROBLOG_LOCAL_CACHE_ENTRIES) e `local`
+    è True i valori vengono prima cercati nella memoria del processo; le
+    invalidazioni, provocate da `signals` o dal salvataggio di uno dei
+    `models`, rimuovono le chiavi da entrambi i livelli.
+
+    Se viene specificato `ns` (una stringa o una funzione che riceve gli
+    stessi argomenti di `f`) ogni chiave appartiene ad un namespace e include
+    il suo contatore di generazione; in questo caso `ikey` deve restituire i
+    namespace da invalidare e l'invalidazione è un singolo incr per
+    namespace, indipendentemente dal numero di chiavi coinvolte.
+
+    Con `lock` solo un processo alla volta ricalcola un valore mancante (il
+    lock è ottenuto con cache.add), gli altri ricevono l'ultimo valore
+    calcolato, anche se invalidato, o in sua assenza lo calcolano senza
+    salvarlo. Con `soft_timeout` il valore viene ricalcolato da un solo
+    processo trascorsi `soft_timeout` secondi, mentre gli altri continuano
+    ad usare quello presente.
+    """
+    use_local = local and local_cache is not None
+    # se servono lock o soft_timeout in cache finisce la tupla
+    # (scadenza soft, valore)
+    envelope = lock or soft_timeout is not None
     def decorator(f):
+        name = f.__name__
+        cached_functions.append(name)
 
         def invalidate(sender, **kwargs):
             if ikey is None:
-                ks = (f.__name__,)
+                ks = (f.__name__ if ns is None else ns,)
             elif callable(ikey):
                 k = ikey(sender, **kwargs)
                 if isinstance(k, basestring):
@@ -24,8 +243,15 @@ def cache_me(key=None, ikey=None, signals=(), models=(), timeout=WEEK):
                     ks = k
             else:
                 ks = (ikey,)
-            if ks:
+            if not ks:
+                return
+            _record(name, 'invalidation', len(ks))
+            if ns is not None:
+                invalidate_namespaces(ks)
+            else:
                 cache.delete_many(map(hashme, ks))
+                if use_local:
+                    local_cache.delete_many(ks)
 
         if ikey or (ikey is None and key is None):
             for s in signals:
@@ -35,65 +261,402 @@ def cache_me(key=None, ikey=None, signals=(), models=(), timeout=WEEK):
                 post_save.connect(invalidate, sender=m, weak=False)
                 post_delete.connect(invalidate, sender=m, weak=False)
 
-        def _key(*args, **kwargs):
+        def _basekey(*args, **kwargs):
             if key is None:
                 k = f.__name__
             elif callable(key):
                 k = key(*args, **kwargs)
             else:
                 k = key % args
-            return hashme(k)
+            return k
+
+        def _namespace(*args, **kwargs):
+            if callable(ns):
+                return ns(*args, **kwargs)
+            return ns
+
+        def _rawkeys(argslist):
+            keys = [ _basekey(*a) for a in argslist ]
+            if ns is None:
+                return keys
+            nss = [ _namespace(*a) for a in argslist ]
+            gens = generations(set(nss))
+            return [ '%s@%s' % (k, gens[n]) for k, n in zip(keys, nss) ]
+
+        def _rawkey(*args, **kwargs):
+            k = _basekey(*args, **kwargs)
+            if ns is not None:
+                n = _namespace(*args, **kwargs)
+                k = '%s@%s' % (k, generations((n,))[n])
+            return k
+
+        def _key(*args, **kwargs):
+            return hashme(_rawkey(*args, **kwargs))
+
+        def _pack(data):
+            if not envelope:
+                return data
+            if soft_timeout is None:
+                return (None, data)
+            return (time.time() + soft_timeout, data)
+
+        def _compute(args, kwargs):
+            _record(name, 'miss')
+            if stats is None:
+                return f(*args, **kwargs)
+            start = time.time()
+            data = f(*args, **kwargs)
+            _record(name, 'fill_ms', (time.time() - start) * 1000)
+            _record_size(name, data)
+            return data
+
+        def _timeout(staleness):
+            # un valore calcolato a partire da altri valori non aggiornati
+            # resta in cache solo finché lo sono loro
+            if staleness.window:
+                return min(timeout, staleness.window)
+            return timeout
+
+        def _fill(hk, args, kwargs):
+            with track_staleness() as staleness:
+                data = _compute(args, kwargs)
+            cache.set(hk, _pack(data), _timeout(staleness))
+            if lock:
+                # la copia "stale" non include la generazione e non viene
+                # rimossa dalle invalidazioni
+                cache.set(hashme(_basekey(*args, **kwargs)) + ':stale', data, timeout)
+            return data
 
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            k = _key(*args, **kwargs)
-            data = cache.get(k)
+            k = _rawkey(*args, **kwargs)
+            if use_local:
+                data = local_cache.get(k)
+                if data is not None:
+                    _record(name, 'local_hit')
+                    _mark_stale(settings.MICROBLOG_LOCAL_CACHE_TIMEOUT)
+                    return data
+            hk = hashme(k)
+            data = cache.get(hk)
             if data is None:
-                data = f(*args, **kwargs)
-                cache.set(k, data, timeout)
+                if not lock:
+                    data = _fill(hk, args, kwargs)
+                elif cache.add(hk + ':lock', 1, settings.MICROBLOG_CACHE_LOCK_TIMEOUT):
+                    try:
+                        data = _fill(hk, args, kwargs)
+                    finally:
+                        cache.delete(hk + ':lock')
+                else:
+                    # qualcun altro sta già calcolando il valore
+                    data = cache.get(hashme(_basekey(*args, **kwargs)) + ':stale')
+                    if data is None:
+                        data = _compute(args, kwargs)
+                    else:
+                        _record(name, 'stale')
+                        _mark_stale(settings.MICROBLOG_CACHE_LOCK_TIMEOUT)
+                    return data
+            elif envelope:
+                refresh, data = data
+                if refresh is not None and refresh < time.time() \
+                    and cache.add(hk + ':lock', 1, settings.MICROBLOG_CACHE_LOCK_TIMEOUT):
+                    # il ricalcolo viene conteggiato come miss
+                    try:
+                        data = _fill(hk, args, kwargs)
+                    finally:
+                        cache.delete(hk + ':lock')
+                else:
+                    _record(name, 'hit')
+            else:
+                _record(name, 'hit')
+            if use_local:
+                local_cache.set(k, data)
             return data
         wrapper.cachekey = _key
+
+        def get_many(argslist, loader):
+            """
+            Come `wrapper` ma per più chiamate alla volta; `loader` riceve la
+            lista degli argomenti (tuple) non presenti in cache e deve
+            restituire un dizionario argomenti -> valore. Il risultato è la
+            lista dei valori nello stesso ordine di `argslist`, None per gli
+            argomenti che `loader` non ha saputo risolvere.
+            """
+            argslist = map(tuple, argslist)
+            keys = _rawkeys(argslist)
+            found = {}
+            if use_local:
+                for k in keys:
+                    data = local_cache.get(k)
+                    if data is not None:
+                        found[k] = data
+                _record(name, 'local_hit', len(found))
+                if found:
+                    _mark_stale(settings.MICROBLOG_LOCAL_CACHE_TIMEOUT)
+            hkeys = dict((hashme(k), k) for k in keys if k not in found)
+            if hkeys:
+                for hk, data in cache.get_many(hkeys.keys()).items():
+                    if envelope:
+                        data = data[1]
+                    found[hkeys[hk]] = data
+                    _record(name, 'hit')
+                    if use_local:
+                        local_cache.set(hkeys[hk], data)
+            missing = dict((k, a) for a, k in zip(argslist, keys) if k not in found)
+            if missing:
+                _record(name, 'miss', len(missing))
+                start = time.time()
+                with track_staleness() as staleness:
+                    loaded = loader(missing.values())
+                _record(name, 'fill_ms', (time.time() - start) * 1000)
+                store = {}
+                for k, a in missing.items():
+                    data = loaded.get(a)
+                    if data is None:
+                        continue
+                    found[k] = data
+                    store[hashme(k)] = _pack(data)
+                    _record_size(name, data)
+                    if use_local:
+                        local_cache.set(k, data)
+                if store:
+                    cache.set_many(store, _timeout(staleness))
+            return [ found.get(k) for k in keys ]
+        wrapper.get_many = get_many
             
         return wrapper
     return decorator
 
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-from django.conf import settings as dsettings
+from datetime import datetime
 from django.contrib import comments
-from django.core.urlresolvers import reverse
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max, Q
 from microblog import models
-from microblog import settings
-from taggit.models import TaggedItem
-
-def _i_post_list(sender, **kw):
-    ks = []
-    for l in dsettings.LANGUAGES:
-        ks.append('m:post_list:%s' % l[0])
-    return ks
-@cache_me(models=(models.Post,),
-    key='m:post_list:%s',
-    ikey=_i_post_list)
-def post_list(lang):
+from microblog import records
+from taggit.models import Tag, TaggedItem
+
+@cache_me(models=(models.Post, models.PostContent, TaggedItem, Tag),
+    key='m:post_index:%s',
+    ns='m:post_list',
+    ikey='m:post_list',
+    lock=True,
+    soft_timeout=DAY)
+def post_index(lang):
+    """
+    Restituisce i post nella lingua `lang`, ordinati per data decrescente,
+    insieme ad un indice per anno, mese, categoria, autore, tag, stato e
+    featured. L'indice associa ad ogni valore l'array ordinato delle
+    posizioni (in 'posts') dei post corrispondenti.
+    """
     qs = models.Post.objects\
         .all()\
         .byLanguage(lang)\
         .order_by('-date')\
         .select_related('category', 'author')
-    return list(qs)
+    posts = list(qs)
+
+    tags = defaultdict(list)
+    items = TaggedItem.objects\
+        .filter(content_type__app_label='microblog', content_type__model='post')\
+        .values_list('object_id', 'tag__name')
+    for pid, name in items:
+        tags[pid].append(name.lower())
 
-@cache_me(models=(models.Post,))
+    index = {
+        'featured': [],
+        'non-featured': [],
+        'published': [],
+        'year': defaultdict(list),
+        'month': defaultdict(list),
+        'category': defaultdict(list),
+        'author': defaultdict(list),
+        'tag': defaultdict(list),
+    }
+    for ix, p in enumerate(posts):
+        index['featured' if p.featured else 'non-featured'].append(ix)
+        if p.is_published():
+            index['published'].append(ix)
+        index['year'][p.date.year].append(ix)
+        index['month'][(p.date.year, p.date.month)].append(ix)
+        index['category'][p.category_id].append(ix)
+        index['author'][p.author_id].append(ix)
+        for name in set(tags[p.id]):
+            index['tag'][name].append(ix)
+
+    output = {'posts': posts}
+    for k, v in index.items():
+        if isinstance(v, dict):
+            output[k] = dict((x, array('I', y)) for x, y in v.items())
+        else:
+            output[k] = array('I', v)
+    return output
+
+def intersect_postings(postings):
+    """
+    Interseca gli array ordinati di posizioni restituiti da post_index; il
+    costo dipende dalla lunghezza dell'array più corto.
+    """
+    postings = sorted(postings, key=len)
+    output = []
+    for ix in postings[0]:
+        for p in postings[1:]:
+            i = bisect_left(p, ix)
+            if i == len(p) or p[i] != ix:
+                break
+        else:
+            output.append(ix)
+    return output
+
+def post_list(lang):
+    return post_index(lang)['posts']
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+def encode_cursor(post):
+    """
+    Restituisce il cursore che identifica la posizione di `post` nella lista
+    dei post ordinata per (data, id) decrescenti.
+    """
+    return '%s-%s' % (post.date.strftime(CURSOR_FORMAT), post.id)
+
+def decode_cursor(cursor):
+    """
+    Inverso di encode_cursor, solleva ValueError se il cursore non è valido.
+    """
+    d, pid = cursor.split('-', 1)
+    return datetime.strptime(d, CURSOR_FORMAT), int(pid)
+
+@cache_me(models=(models.Post, models.PostContent),
+    key='m:post_page:%s:%s:%s:%s',
+    ns='m:post_list',
+    ikey='m:post_list')
+def post_page(lang, visibility, cursor, size):
+    """
+    Restituisce una pagina di `size` post in lingua `lang` più vecchi di
+    `cursor` (None per la prima pagina), usando la paginazione per chiave
+    (data, id) invece che per offset: la query legge solo le righe della
+    pagina e i cursori di una pagina non cambiano quando vengono pubblicati
+    nuovi post.
+
+    Il risultato è un dizionario con i post e il cursore della pagina
+    successiva ('next', None se questa è l'ultima).
+    """
+    qs = models.Post.objects\
+        .all()\
+        .byLanguage(lang)\
+        .order_by('-date', '-id')\
+        .select_related('category', 'author')
+    if visibility == 'public':
+        qs = qs.published()
+    if cursor is not None:
+        date, pid = decode_cursor(cursor)
+        qs = qs.filter(Q(date__lt=date) | Q(date=date, id__lt=pid))
+    posts = list(qs[:size + 1])
+    if len(posts) > size:
+        posts = posts[:size]
+        next_cursor = encode_cursor(posts[-1])
+    else:
+        next_cursor = None
+    return {
+        'posts': posts,
+        'cursor': cursor,
+        'next': next_cursor,
+    }
+
+def build_facets(posts, tmap):
+    """
+    Calcola il numero di post per anno, mese, autore, categoria e tag.
+    """
+    facets = {
+        'years': defaultdict(int),
+        'months': defaultdict(int),
+        'authors': defaultdict(int),
+        'categories': defaultdict(int),
+        'tags': defaultdict(int),
+        # le istanze di autori e categorie, servono ai template
+        'users': {},
+        'category_objs': {},
+    }
+    for p in posts:
+        facets['years'][p.date.year] += 1
+        facets['months'][(p.date.year, p.date.month)] += 1
+        facets['authors'][p.author_id] += 1
+        facets['categories'][p.category_id] += 1
+        for t in tmap.get(p.id, ()):
+            facets['tags'][t.name] += 1
+        facets['users'].setdefault(p.author_id, p.author)
+        facets['category_objs'].setdefault(p.category_id, p.category)
+    for k, v in facets.items():
+        facets[k] = dict(v)
+    return facets
+
+@cache_me(models=(models.Post, models.PostContent, TaggedItem, Tag),
+    key='m:post_facets:%s:%s',
+    ns='m:post_facets',
+    ikey='m:post_facets')
+def post_facets(lang, visibility):
+    """
+    Conteggi (vedi build_facets) dei post in lingua `lang`; con visibility
+    'public' sono considerati solo i post pubblicati.
+
+    Viene invalidata dagli stessi modelli di post_index, da cui deriva.
+    """
+    posts = post_list(lang)
+    if visibility == 'public':
+        posts = [ p for p in posts if p.is_published() ]
+    return build_facets(posts, tag_map())
+
+def _post_snapshot(sender, instance, **kw):
+    # lo stato del post prima del salvataggio, serve ad _invalidate_feeds
+    if instance.id is None:
+        instance._snapshot = None
+        return
+    try:
+        instance._snapshot = models.Post.objects.get(id=instance.id)
+    except models.Post.DoesNotExist:
+        instance._snapshot = None
+pre_save.connect(_post_snapshot, sender=models.Post)
+
+@cache_me(models=(models.Category,),
+    ns='m:category_names',
+    ikey='m:category_names')
+def category_names():
+    """
+    restituisce un dizionario id -> nome di tutte le categorie
+    """
+    return dict(models.Category.objects.values_list('id', 'name'))
+
+@cache_me(models=(models.Post, TaggedItem, Tag),
+    key='m:tag_map:v%d' % records.VERSION,
+    ns='m:tag_map',
+    ikey='m:tag_map')
 def tag_map():
     tmap = defaultdict(set)
     items = TaggedItem.objects\
         .filter(content_type__app_label='microblog', content_type__model='post')\
         .select_related('tag')
     for o in items:
-        tmap[o.object_id].add(o.tag)
+        tmap[o.object_id].add(records.TagRecord.from_tag(o.tag))
     return tmap
 
-@cache_me(models=(models.Post,),
-           key = 'm:tagged_posts:%s',
-           ikey = 'm:tagged_posts:%s')
+def _i_tagged_posts(sender, **kw):
+    if sender is Tag:
+        name = kw['instance'].name
+    else:
+        try:
+            name = kw['instance'].tag.name
+        except Tag.DoesNotExist:
+            # il tag è stato cancellato, e la sua cancellazione ha già
+            # provocato l'invalidazione
+            return None
+    return 'm:tagged_posts:%s' % name.lower()
+@cache_me(models=(TaggedItem, Tag),
+    key='m:tagged_posts:%s',
+    ns=lambda name: 'm:tagged_posts:%s' % name.lower(),
+    ikey=_i_tagged_posts)
 def tagged_posts(name):
     """
     restituisce i post taggati con il tag passato
@@ -105,28 +668,29 @@ def tagged_posts(name):
     return set(posts)
 
 def _i_post_data(sender, **kw):
+    o = kw['instance']
     if sender is models.Post:
-        pid = kw['instance'].id
-    elif sender is comments.get_model():
-        o = kw['instance']
-        if o.content_type.app_label == 'microblog' and o.content_type.model == 'post':
-            pid = o.object_pk
-        else:
+        pid = o.id
+    elif sender is comments.get_model() or sender is TaggedItem:
+        if o.content_type_id != ContentType.objects.get_for_model(models.Post).id:
             pid = None
+        elif sender is TaggedItem:
+            pid = o.object_id
+        else:
+            pid = o.object_pk
     else:
-        pid = kw['instance'].post_id
-    ks = []
+        pid = o.post_id
     if pid:
-        for l in dsettings.LANGUAGES:
-            ks.append('m:post_data:%s%s' % (pid, l[0]))
-    return ks
-@cache_me(models=(models.Post, models.PostContent, comments.get_model()),
-    key='m:post_data:%s%s',
+        return 'm:post_data:%s' % pid
+@cache_me(models=(models.Post, models.PostContent, comments.get_model(), TaggedItem),
+    key='m:post_data:%%s%%s:v%d' % records.VERSION,
+    ns=lambda pid, lang: 'm:post_data:%s' % pid,
     ikey=_i_post_data)
 def post_data(pid, lang):
     post = models.Post.objects\
         .select_related('author', 'category')\
         .get(id=pid)
+    models.Post.attach_contents([post])
     try:
         content = post.content(lang=lang, fallback=True)
     except models.PostContent.DoesNotExist:
@@ -134,30 +698,127 @@ def post_data(pid, lang):
 
     comment_list = comments.get_model().objects\
         .filter(content_type__app_label='microblog', content_type__model='post')\
-        .filter(object_pk=pid, is_public=True)
+        .filter(object_pk=pid, is_public=True)\
+        .select_related('user')
+
+    return _post_data(post, content, list(comment_list), list(post.tags.all()))
 
-    burl = models.PostContent.build_absolute_url(post, content)
+def _post_data(post, content, comment_list, tags):
+    """
+    Costruisce il risultato di post_data; in cache finiscono solo i record
+    (vedi microblog.records) non le istanze dei modelli.
+    """
+    url = None
+    if content is not None:
+        if settings.MICROBLOG_URL_STYLE == 'category':
+            args = (None, post.category.name, content.slug)
+        else:
+            args = (post.date, None, content.slug)
+        url = models.permalink(*args)
+        # il permalink permette a prepare_summary di non richiedere di nuovo
+        # post_data
+        content = records.ContentRecord.from_content(
+            content, models.post_url_path(*args), url)
+    try:
+        # i contenuti sono già stati caricati, non servono altre query
+        purl = post.get_absolute_url()
+    except models.PostContent.DoesNotExist:
+        purl = None
     return {
-        'post': post,
+        'post': records.PostRecord.from_post(post, purl),
         'content': content,
-        'url': dsettings.DEFAULT_URL_PREFIX + reverse(burl[0], args=burl[1], kwargs=burl[2]),
-        'comments': list(comment_list),
-        'tags': list(post.tags.all()),
+        'url': url,
+        'comments': map(records.CommentRecord.from_comment, comment_list),
+        'tags': map(records.TagRecord.from_tag, tags),
     }
 
+def _load_post_data(argslist):
+    """
+    Popola i dati di più post_data con un numero fisso di query: una per i
+    post, una per i contenuti, una per i commenti e una per i tag.
+    """
+    pids = set(pid for pid, lang in argslist)
+    posts = models.Post.objects\
+        .select_related('author', 'category')\
+        .in_bulk(pids)
+
+    models.Post.attach_contents(posts.values())
+
+    comment_map = defaultdict(list)
+    comment_list = comments.get_model().objects\
+        .filter(content_type__app_label='microblog', content_type__model='post')\
+        .filter(object_pk__in=map(str, pids), is_public=True)\
+        .select_related('user')
+    for c in comment_list:
+        comment_map[int(c.object_pk)].append(c)
+
+    tmap = defaultdict(list)
+    items = TaggedItem.objects\
+        .filter(content_type__app_label='microblog', content_type__model='post')\
+        .filter(object_id__in=pids)\
+        .select_related('tag')
+    for o in items:
+        tmap[o.object_id].append(o.tag)
+
+    output = {}
+    for pid, lang in argslist:
+        try:
+            post = posts[pid]
+        except KeyError:
+            continue
+        try:
+            content = post.content(lang=lang, fallback=True)
+        except models.PostContent.DoesNotExist:
+            content = None
+        output[(pid, lang)] = _post_data(post, content, comment_map[pid], tmap[pid])
+    return output
+
+def post_data_many(pids, lang):
+    """
+    Come post_data ma per una lista di post; utilizza un'unica richiesta
+    verso la cache e, per i post non presenti, un numero fisso di query.
+    """
+    return post_data.get_many([ (pid, lang) for pid in pids ], _load_post_data)
+
+def _i_author_by_slug(sender, **kw):
+    o = kw['instance']
+    if sender is models.AuthorSlug:
+        slugs = set((o.slug, getattr(o, '_old_slug', None) or o.slug))
+    else:
+        slugs = (models.author_slug(o),)
+    return [ 'm:author:%s' % s for s in slugs ]
+@cache_me(models=(models.AuthorSlug, User),
+    key='m:author:%s',
+    ns=lambda slug: 'm:author:%s' % slug,
+    ikey=_i_author_by_slug)
+def author_by_slug(slug):
+    """
+    Restituisce l'utente con lo slug passato, False se non esiste.
+    """
+    authors = models.AuthorSlug.objects\
+        .filter(slug=slug)\
+        .select_related('user')\
+        .order_by('user')
+    try:
+        return authors[0].user
+    except IndexError:
+        return False
+
 def _i_get_reactions(sender, **kw):
     if sender is models.Trackback:
-        return 'm:reaction:%s' % kw['instance'].content_id
+        return 'm:reactions:%s' % kw['instance'].content_id
     else:
-        return 'm:reaction:%s' % kw['instance'].object_id
+        return 'm:reactions:%s' % kw['instance'].object_id
 if settings.MICROBLOG_PINGBACK_SERVER:
-    deco = cache_me(models=(models.Trackback,),
+    from pingback.models import Pingback
+    deco = cache_me(models=(models.Trackback, Pingback),
         key='m:reactions:%s',
+        ns=lambda cid: 'm:reactions:%s' % cid,
         ikey=_i_get_reactions)
 else:
-    from pingback.models import Pingback
-    deco = cache_me(models=(models.Trackback, Pingback),
+    deco = cache_me(models=(models.Trackback,),
         key='m:reactions:%s',
+        ns=lambda cid: 'm:reactions:%s' % cid,
         ikey=_i_get_reactions)
 @deco
 def get_reactions(cid):
@@ -175,3 +836,180 @@ def get_reactions(cid):
         if not hasattr(r, 'excerpt'):
             r.excerpt = r.content
     return reactions
+
+# marcatore delle modifiche ai contenuti in una lingua qualsiasi
+ANY_LANGUAGE = '*'
+
+def _changed_key(lang):
+    return 'm:last_changed:' + hashme(lang or '')
+
+def _last_changed_db(lang):
+    contents = models.PostContent.objects.all()
+    if lang and lang != ANY_LANGUAGE:
+        contents = contents.filter(language=lang)
+    ctype = ContentType.objects.get_for_model(models.Post)
+    dates = [
+        models.Post.objects.aggregate(d=Max('modified'))['d'],
+        contents.aggregate(d=Max('modified'))['d'],
+        comments.get_model().objects\
+            .filter(content_type=ctype)\
+            .aggregate(d=Max('submit_date'))['d'],
+        models.Trackback.objects.aggregate(d=Max('date'))['d'],
+    ]
+    dates = [ d for d in dates if d is not None ]
+    if not dates:
+        return 0.0
+    return time.mktime(max(dates).timetuple())
+
+def last_changed(lang):
+    """
+    Restituisce il timestamp dell'ultima modifica che può aver cambiato le
+    pagine (o i feed) in lingua `lang`.
+
+    Il valore è il massimo tra due marcatori, uno per la lingua (aggiornato
+    dal salvataggio dei PostContent) e uno comune a tutte (post, commenti,
+    reactions, categorie e tag), che i segnali impostano all'istante della
+    modifica; solo quando mancano dalla cache vengono ricalcolati dal db.
+
+    Con `lang` None considera i contenuti in qualsiasi lingua.
+    """
+    keys = dict((_changed_key(l), l) for l in (lang or ANY_LANGUAGE, None))
+    found = cache.get_many(keys.keys())
+    for k, l in keys.items():
+        if k not in found:
+            t = _last_changed_db(l)
+            if not cache.add(k, t, GENERATION_TIMEOUT):
+                t = cache.get(k) or t
+            found[k] = t
+    return max(found.values())
+
+def _touch_last_changed(sender, instance, **kw):
+    if sender is models.PostContent:
+        langs = (instance.language, ANY_LANGUAGE)
+    else:
+        langs = (None,)
+    now = time.time()
+    cache.set_many(dict((_changed_key(l), now) for l in langs), GENERATION_TIMEOUT)
+
+_changed_senders = [
+    models.Post, models.PostContent, models.Category, models.Trackback,
+    comments.get_model(), Tag, TaggedItem,
+]
+if settings.MICROBLOG_PINGBACK_SERVER:
+    from pingback.models import Pingback
+    _changed_senders.append(Pingback)
+for m in _changed_senders:
+    post_save.connect(_touch_last_changed, sender=m, weak=False)
+    post_delete.connect(_touch_last_changed, sender=m, weak=False)
+
+FEEDS = 'm:feeds'
+
+def feed_namespaces(lang, archive=False):
+    """
+    Namespace (vedi generations) da cui dipende un feed in lingua `lang`.
+
+    Le pagine di archivio (i post più vecchi di un cursore) dipendono da un
+    namespace separato che non viene invalidato dalla pubblicazione di un
+    post più recente di tutti gli altri (vedi _feed_head).
+    """
+    ns = '%s:%s' % (FEEDS, lang)
+    if archive:
+        ns += ':archive'
+    return [FEEDS, ns]
+
+def feed_facet_namespace(facet, value):
+    """
+    Namespace dei feed dei post con il tag, la categoria o l'autore `value`
+    (il valore usato da post_index).
+    """
+    return '%s:%s:%s' % (FEEDS, facet, value)
+
+def _post_feed_facets(post, old=None):
+    nss = set()
+    for p in (post, old):
+        if p is not None:
+            nss.add(feed_facet_namespace('category', p.category_id))
+            nss.add(feed_facet_namespace('author', p.author_id))
+    for t in tag_map().get(post.id, ()):
+        nss.add(feed_facet_namespace('tag', t.name.lower()))
+    return nss
+
+def _invalidate_feeds(sender, instance, **kw):
+    # nei feed compaiono solo i post pubblicati, le modifiche alle bozze non
+    # richiedono di rigenerarli
+    if sender is models.Post:
+        old = getattr(instance, '_snapshot', None)
+        if not instance.is_published() and (old is None or not old.is_published()):
+            return
+        languages = models.PostContent.objects\
+            .filter(post=instance)\
+            .values_list('language', flat=True)
+        new = 'created' in kw and (old is None or not old.is_published())
+        post = instance
+        nss = _post_feed_facets(instance, old)
+    elif sender is models.PostContent:
+        try:
+            post = models.Post.objects.get(id=instance.post_id)
+        except models.Post.DoesNotExist:
+            # cancellazione a cascata, i feed dei facet vengono invalidati
+            # dalla cancellazione del post
+            post = None
+        if 'created' in kw and (post is None or not post.is_published()):
+            return
+        languages = [ instance.language ]
+        new = kw.get('created', False)
+        nss = _post_feed_facets(post) if post is not None else set()
+    elif sender is TaggedItem:
+        if instance.content_type_id != ContentType.objects.get_for_model(models.Post).id:
+            return
+        try:
+            post = models.Post.objects.get(id=instance.object_id)
+        except models.Post.DoesNotExist:
+            # cancellazione a cascata, ci pensa la cancellazione del post
+            return
+        # un cambio di stato del post è già stato gestito dal suo salvataggio
+        if not post.is_published():
+            return
+        languages = models.PostContent.objects\
+            .filter(post=post)\
+            .values_list('language', flat=True)
+        # i tag compaiono anche nelle pagine di archivio
+        new = False
+        nss = set()
+        try:
+            nss.add(feed_facet_namespace('tag', instance.tag.name.lower()))
+        except Tag.DoesNotExist:
+            # cancellazione a cascata, ci pensa la cancellazione del tag
+            pass
+    else:
+        # i tag sono le categorie degli item, le categorie possono far parte
+        # delle loro url; solo una rinomina (o cancellazione) richiede di
+        # rigenerare tutti i feed, un tag o una categoria appena creati non
+        # sono ancora usati
+        if kw.get('created'):
+            return
+        invalidate_namespaces([ FEEDS ])
+        return
+    for l in languages:
+        nss.add(feed_namespaces(l)[1])
+        if not (new and _feed_head(post, l)):
+            nss.add(feed_namespaces(l, archive=True)[1])
+    invalidate_namespaces(nss)
+
+def _feed_head(post, lang):
+    """
+    True se `post` è più recente di tutti gli altri post pubblicati in
+    lingua `lang`: un post nuovo con questa caratteristica compare solo
+    nella prima pagina del feed, le pagine di archivio (i post più vecchi
+    di un cursore) non cambiano.
+    """
+    head = models.PostContent.objects\
+        .filter(language=lang, post__status='P')\
+        .exclude(headline='')\
+        .exclude(post=post)\
+        .aggregate(d=Max('post__date'))['d']
+    return head is None or post.date > head
+
+for m in (models.Post, models.PostContent, models.Category, Tag, TaggedItem):
+    post_save.connect(_invalidate_feeds, sender=m, weak=False)
+    post_delete.connect(_invalidate_feeds, sender=m, weak=False)
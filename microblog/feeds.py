@@ -1,10 +1,16 @@
 # -*- coding: UTF-8 -*-
 from django.conf import settings as dsettings
 from django.contrib.syndication.views import Feed, FeedDoesNotExist
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.feedgenerator import Rss201rev2Feed
 
+from microblog import dataaccess
 from microblog import models
 from microblog import settings
+from microblog.pagecache import conditional
 
 import os.path
 
@@ -21,45 +27,269 @@ class FeedsDict(dict):
 languages = FeedsDict((l, l) for l, n in dsettings.LANGUAGES)
 languages[None] = settings.MICROBLOG_DEFAULT_LANGUAGE
 
+def feed_language(request, lang_code=None, *args, **kwargs):
+    l = languages.get(lang_code, lang_code)
+    return l.split('-', 1)[0] if l else l
+
+def feed_cursor(request):
+    """
+    Restituisce il cursore (vedi dataaccess.encode_cursor) della pagina di
+    feed richiesta, None per la prima; solleva ValueError se non è valido.
+    """
+    cursor = request.GET.get('before') or None
+    if cursor is not None:
+        dataaccess.decode_cursor(cursor)
+    return cursor
+
+class PagedFeed(Rss201rev2Feed):
+    """
+    Feed RSS con i link di paginazione della RFC 5005 (first e next, la
+    pagina con i post più vecchi).
+    """
+    def add_root_elements(self, handler):
+        super(PagedFeed, self).add_root_elements(handler)
+        for rel in ('first', 'next'):
+            href = self.feed.get(rel + '_link')
+            if href:
+                handler.addQuickElement(u'atom:link', None, {u'rel': rel, u'href': href})
+
 class LatestPosts(Feed):
+    feed_type = PagedFeed
+
+    def __call__(self, request, *args, **kwargs):
+        view = conditional(feed_language)(self.cached)
+        return view(request, *args, **kwargs)
+
+    def namespaces(self, request, *args, **kwargs):
+        # una pagina di archivio ha un cursore valido, con un cursore non
+        # valido la risposta è un 404 e non finisce in cache
+        return dataaccess.feed_namespaces(
+            feed_language(request, *args, **kwargs),
+            archive=bool(request.GET.get('before')))
+
+    def cached(self, request, *args, **kwargs):
+        """
+        Restituisce il feed renderizzato una sola volta per dominio e url, il
+        documento in cache viene rigenerato quando cambia la generazione dei
+        namespace da cui dipende.
+        """
+        nss = self.namespaces(request, *args, **kwargs)
+        gens = dataaccess.generations(nss)
+        k = 'm:feed:%s:%s:%s:%s' % (
+            request.get_host(),
+            request.path,
+            request.GET.get('before', ''),
+            ':'.join(str(gens[n]) for n in nss))
+        hk = dataaccess.hashme(k)
+        data = cache.get(hk)
+        if data is None:
+            with dataaccess.track_staleness() as staleness:
+                response = super(LatestPosts, self).__call__(request, *args, **kwargs)
+            data = (response['Content-Type'], response.content)
+            # un feed generato da dati non aggiornati (ad esempio un
+            # post_index in ricostruzione) resta in cache solo finché lo sono
+            # quei dati
+            timeout = settings.MICROBLOG_FEED_CACHE_TIMEOUT
+            if staleness.window:
+                timeout = min(timeout, staleness.window)
+            cache.set(hk, data, timeout)
+        return HttpResponse(data[1], content_type=data[0])
 
     def get_object(self, request, lang_code=None):
-        return languages[lang_code]
+        lang = languages[lang_code]
+        return self.page(request, lang, self.contents(lang))
+
+    def contents(self, lang):
+        return models.PostContent.objects\
+                .all()\
+                .filter(language=lang, post__status='P')\
+                .exclude(headline='')\
+                .select_related('post', 'post__author')
+
+    def page(self, request, lang, contents):
+        """
+        Restituisce l'oggetto del feed: la pagina di `contents` individuata
+        dal parametro "before" della richiesta, con la paginazione per
+        chiave (data, id) del post come dataaccess.post_page.
+        """
+        cursor = self.cursor(request)
+        if cursor is not None:
+            date, pid = cursor
+            contents = contents.filter(
+                Q(post__date__lt=date) | Q(post__date=date, post__id__lt=pid))
+        size = settings.MICROBLOG_FEED_ITEMS
+        items = contents.order_by('-post__date', '-post__id')[:size + 1]
+        return self.build_page(request, lang, list(items))
+
+    def cursor(self, request):
+        try:
+            cursor = feed_cursor(request)
+        except ValueError:
+            raise FeedDoesNotExist()
+        if cursor is not None:
+            cursor = dataaccess.decode_cursor(cursor)
+        return cursor
+
+    def build_page(self, request, lang, items):
+        # `items` contiene un elemento in più della pagina se esiste la
+        # pagina successiva
+        size = settings.MICROBLOG_FEED_ITEMS
+        first = request.build_absolute_uri(request.path)
+        if len(items) > size:
+            items = items[:size]
+            next_link = '%s?before=%s' % (first, dataaccess.encode_cursor(items[-1].post))
+        else:
+            next_link = None
+        return {
+            'lang': lang,
+            'items': self.attach_tags(items),
+            'first': first,
+            'next': next_link,
+        }
+
+    def feed_extra_kwargs(self, obj):
+        return {
+            'first_link': obj['first'],
+            'next_link': obj['next'],
+        }
 
     def link(self, obj):
         try:
             path = reverse('microblog-feeds-latest')
         except:
-            path = reverse('microblog-feeds-latest', kwargs={'lang_code': obj})
+            path = reverse('microblog-feeds-latest', kwargs={'lang_code': obj['lang']})
         return os.path.join(dsettings.DEFAULT_URL_PREFIX, path)
 
     title = settings.MICROBLOG_TITLE
     description = settings.MICROBLOG_DESCRIPTION
-    description_template = 'microblog/feeds/item_description.html'
+    if settings.MICROBLOG_FEED_FULL_CONTENT:
+        description_template = 'microblog/feeds/item_description.html'
     author_name = settings.MICROBLOG_AUTHOR_NAME
     author_email = settings.MICROBLOG_AUTHOR_EMAIL
     author_link = settings.MICROBLOG_AUTHOR_LINK
 
     def items(self, obj):
-        return models.PostContent.objects\
-                .all()\
-                .filter(language=obj, post__status='P')\
-                .exclude(headline='')\
-                .select_related('post', 'post__author')\
-                .order_by('-post__date')[:10]
+        return obj['items']
+
+    def attach_tags(self, items):
+        """
+        Assegna ad ogni item i nomi dei tag del suo post, letti dalla
+        tag_map invece che con una query per item.
+        """
+        items = list(items)
+        tmap = dataaccess.tag_map()
+        for item in items:
+            item.tag_names = sorted(t.name for t in tmap.get(item.post_id, ()))
+        return items
 
     def item_title(self, item):
         return item.headline
 
     def item_description(self, item):
-        return item.body
+        return item.summary
 
     def item_pubdate(self, item):
         return item.post.date
 
     def item_categories(self, item):
-        return [ x.name for x in item.post.tags.all()]
+        return item.tag_names
 
     def item_author_name(self, item):
         user = item.post.author
         return '%s %s' % (user.first_name, user.last_name)
+
+class FacetPosts(LatestPosts):
+    """
+    Feed dei post con un certo tag, categoria o autore; i post vengono
+    selezionati con le posting list di dataaccess.post_index e il feed
+    renderizzato viene invalidato solo dalle modifiche ai post del facet
+    (vedi dataaccess.feed_facet_namespace).
+
+    Le sottoclassi definiscono `facet` (la chiave dell'indice, che è anche il
+    nome dell'argomento della url) e `link_name` (la url della pagina html);
+    se il valore dell'argomento non coincide con quello usato dall'indice
+    ridefiniscono anche `facet_value`.
+    """
+    facet = None
+    link_name = None
+
+    def facet_value(self, **kwargs):
+        """
+        Riceve l'argomento della url e restituisce il valore corrispondente
+        nell'indice, None se non esiste.
+        """
+        return kwargs[self.facet]
+
+    def namespaces(self, request, *args, **kwargs):
+        kwargs.pop('lang_code', None)
+        value = self.facet_value(**kwargs)
+        return [
+            dataaccess.FEEDS,
+            dataaccess.feed_facet_namespace(self.facet, value),
+        ]
+
+    def get_object(self, request, lang_code=None, **kwargs):
+        lang = languages[lang_code]
+        value = self.facet_value(**kwargs)
+        if value is None:
+            raise FeedDoesNotExist()
+        index = dataaccess.post_index(lang)
+        positions = dataaccess.intersect_postings([
+            index['published'],
+            index[self.facet].get(value, ()),
+        ])
+        obj = self.index_page(request, lang, [ index['posts'][ix] for ix in positions ])
+        obj['kwargs'] = kwargs
+        return obj
+
+    def index_page(self, request, lang, posts):
+        """
+        Come `page` ma partendo dai post (pubblicati) dell'indice, che sono
+        ordinati solo per data; viene caricato solo il contenuto dei post
+        della pagina.
+        """
+        cursor = self.cursor(request)
+        posts = sorted(posts, key=lambda p: (p.date, p.id), reverse=True)
+        if cursor is not None:
+            posts = [ p for p in posts if (p.date, p.id) < cursor ]
+        posts = posts[:settings.MICROBLOG_FEED_ITEMS + 1]
+        contents = models.PostContent.objects\
+                .filter(post__in=[ p.id for p in posts ], language=lang)\
+                .exclude(headline='')\
+                .select_related('post', 'post__author')
+        contents = dict((c.post_id, c) for c in contents)
+        items = [ contents[p.id] for p in posts if p.id in contents ]
+        return self.build_page(request, lang, items)
+
+    def link(self, obj):
+        path = reverse(self.link_name, kwargs=obj['kwargs'])
+        return os.path.join(dsettings.DEFAULT_URL_PREFIX, path)
+
+    def title(self, obj):
+        return u'%s: %s' % (settings.MICROBLOG_TITLE, obj['kwargs'][self.facet])
+
+class TagPosts(FacetPosts):
+    facet = 'tag'
+    link_name = 'microblog-tag'
+
+    def facet_value(self, tag):
+        # l'indice usa i nomi dei tag in minuscolo
+        return tag.lower()
+
+class CategoryPosts(FacetPosts):
+    facet = 'category'
+    link_name = 'microblog-category'
+
+    def facet_value(self, category):
+        for cid, name in dataaccess.category_names().items():
+            if name == category:
+                return cid
+        return None
+
+class AuthorPosts(FacetPosts):
+    facet = 'author'
+    link_name = 'microblog-author'
+
+    def facet_value(self, author):
+        user = dataaccess.author_by_slug(author)
+        return user.id if user else None
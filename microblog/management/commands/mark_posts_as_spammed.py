@@ -1,27 +1,58 @@
 # -*- coding: UTF-8 -*-
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from microblog import models
 
 from optparse import make_option
+import time
 
 class Command(BaseCommand):
-    args = "account"
+    args = "account [account ...]"
     option_list = BaseCommand.option_list + (
         make_option('--type',
             action='store',
             dest='type',
             default='e',
             help='spam type: e - email, t - twitter'),
+        make_option('--batch-size',
+            action='store',
+            dest='batch_size',
+            type='int',
+            default=1000,
+            help='Spam rows inserted with a single query'),
         )
 
     def handle(self, *args, **options):
-        try:
-            value = args[0]
-        except IndexError:
+        if not args:
             raise CommandError('email address not specified')
+        accounts = sorted(set(args))
+        method = options['type']
+        size = options['batch_size']
+        if size < 1:
+            raise CommandError('invalid batch size')
+
+        start = time.time()
+        posts = list(models.Post.objects.published().values_list('id', flat=True))
+        existent = set(models.Spam.objects\
+            .filter(method=method, value__in=accounts)\
+            .values_list('post_id', 'value'))
+        missing = [
+            (pid, value)
+            for value in accounts
+            for pid in posts
+            if (pid, value) not in existent
+        ]
+        lookup = time.time() - start
+
+        start = time.time()
+        with transaction.commit_on_success():
+            for ix in range(0, len(missing), size):
+                models.Spam.objects.bulk_create([
+                    models.Spam(post_id=pid, method=method, value=value)
+                    for pid, value in missing[ix:ix + size]
+                ])
+        insert = time.time() - start
 
-        for p in models.Post.objects.published():
-            if not p.spammed(method=options['type'], value=value):
-                s = models.Spam(post=p, method=options['type'], value=value)
-                s.save()
+        self.stdout.write('%d posts, %d accounts: %d rows added (lookup %.2fs, insert %.2fs)\n' % (
+            len(posts), len(accounts), len(missing), lookup, insert))
@@ -0,0 +1,153 @@
+# -*- coding: UTF-8 -*-
+from django.conf import settings as dsettings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from microblog import models, settings
+
+from datetime import datetime, timedelta
+from optparse import make_option
+import time
+
+class Command(BaseCommand):
+    args = "benchmark [benchmark ...]"
+    help = "time the microblog hot paths; available benchmarks: bylanguage, urls"
+    option_list = BaseCommand.option_list + (
+        make_option('--posts',
+            action='store',
+            dest='posts',
+            type='int',
+            default=0,
+            help='create N synthetic posts (inside a transaction rolled back at the end) instead of using the existing ones'),
+        make_option('--language',
+            action='store',
+            dest='language',
+            default=settings.MICROBLOG_DEFAULT_LANGUAGE,
+            help='language used by the benchmarks'),
+        make_option('--count',
+            action='store',
+            dest='count',
+            type='int',
+            default=10000,
+            help='number of urls built by the urls benchmark'),
+        make_option('--repeat',
+            action='store',
+            dest='repeat',
+            type='int',
+            default=5,
+            help='number of runs of every benchmark, the best one is reported'),
+        )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('benchmark not specified')
+        benchmarks = []
+        for name in args:
+            try:
+                benchmarks.append(getattr(self, 'bench_' + name))
+            except AttributeError:
+                raise CommandError('unknown benchmark "%s"' % name)
+
+        self.options = options
+        if not options['posts']:
+            for b in benchmarks:
+                b()
+            return
+        # i dati sintetici non devono sopravvivere al benchmark
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            self.create_posts(options['posts'])
+            for b in benchmarks:
+                b()
+        finally:
+            transaction.rollback()
+            transaction.leave_transaction_management()
+
+    def create_posts(self, n, batch=1000):
+        self.stdout.write('creating %d posts...\n' % n)
+        author = User.objects.create(username='microblog-benchmark')
+        category = models.Category.objects.create(name='microblog-benchmark')
+        languages = [ l for l, _ in dsettings.LANGUAGES ]
+        start = datetime.now()
+        first = (models.Post.objects.order_by('-id').values_list('id', flat=True)[:1] or [0])[0] + 1
+        for offset in xrange(0, n, batch):
+            size = min(batch, n - offset)
+            models.Post.objects.bulk_create([
+                models.Post(
+                    id=first + offset + ix,
+                    date=start - timedelta(minutes=offset + ix),
+                    author=author,
+                    category=category,
+                    status='P',
+                    allow_comments=True)
+                for ix in xrange(size)
+            ])
+            contents = []
+            for ix in xrange(size):
+                pid = first + offset + ix
+                for lix, l in enumerate(languages):
+                    # un post su dieci non ha la traduzione nelle lingue
+                    # successive alla prima
+                    headline = '' if lix and pid % 10 == 0 else 'post %d' % pid
+                    contents.append(models.PostContent(
+                        post_id=pid,
+                        language=l,
+                        headline=headline,
+                        slug='post-%d' % pid,
+                        summary='summary',
+                        body='body'))
+            models.PostContent.objects.bulk_create(contents)
+
+    def timeit(self, label, f):
+        best = None
+        for _ in xrange(self.options['repeat']):
+            start = time.time()
+            f()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        self.stdout.write('%-40s %10.2f ms\n' % (label, best * 1000))
+
+    def explain(self, qs):
+        sql, params = qs.query.sql_with_params()
+        if connection.vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+        cursor = connection.cursor()
+        cursor.execute(prefix + sql, params)
+        for row in cursor.fetchall():
+            self.stdout.write('    %s\n' % ' | '.join(map(unicode, row)))
+
+    def bench_bylanguage(self):
+        lang = self.options['language']
+        old = models.Post.objects\
+            .filter(postcontent__language=lang)\
+            .exclude(id__in=models.Post.objects.filter(postcontent__language=lang, postcontent__headline=''))
+        new = models.Post.objects.byLanguage(lang)
+        for label, qs in (('NOT IN subquery', old), ('byLanguage', new)):
+            qs = qs.order_by('-date')
+            self.stdout.write('%s: %d posts\n' % (label, qs.count()))
+            self.explain(qs)
+            self.timeit(label, lambda: list(qs.values_list('id', flat=True)))
+
+    def bench_urls(self):
+        n = self.options['count']
+        start = datetime.now()
+        params = [
+            (start - timedelta(hours=ix), 'category-%d' % (ix % 20), 'post-%d' % ix)
+            for ix in xrange(n)
+        ]
+        def with_reverse():
+            for p in params:
+                name, a, kw = models.PostContent.url_args(*p)
+                reverse(name, args=a, kwargs=kw)
+        def with_formatter():
+            for p in params:
+                models.post_url_path(*p)
+        self.stdout.write('%d post urls\n' % n)
+        self.timeit('reverse()', with_reverse)
+        self.timeit('UrlFormatter', with_formatter)
@@ -0,0 +1,48 @@
+# -*- coding: UTF-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from microblog import dataaccess
+
+from optparse import make_option
+
+class Command(BaseCommand):
+    help = "dump the cache statistics of the dataaccess functions"
+    option_list = BaseCommand.option_list + (
+        make_option('--reset',
+            action='store_true',
+            dest='reset',
+            default=False,
+            help='reset the counters after the dump'),
+        )
+
+    def handle(self, *args, **options):
+        sink = dataaccess.stats
+        if sink is None:
+            raise CommandError('cache statistics are disabled (MICROBLOG_CACHE_STATS)')
+        if not hasattr(sink, 'read'):
+            raise CommandError('the configured stats sink cannot be read back')
+
+        names = sorted(set(dataaccess.cached_functions))
+        data = sink.read(names)
+        row = '%-16s %10s %10s %10s %8s %7s %10s %10s %12s\n'
+        self.stdout.write(row % (
+            'function', 'local_hit', 'hit', 'miss', 'stale', 'ratio',
+            'fill_ms', 'avg_bytes', 'invalidation'))
+        for name in names:
+            d = data[name]
+            requests = d['local_hit'] + d['hit'] + d['miss'] + d['stale']
+            if requests:
+                ratio = '%.1f%%' % (100.0 * (requests - d['miss']) / requests)
+            else:
+                ratio = '-'
+            if d['miss']:
+                fill = '%.1f' % (float(d['fill_ms']) / d['miss'])
+                size = '%d' % (d['bytes'] / d['miss'])
+            else:
+                fill = size = '-'
+            self.stdout.write(row % (
+                name, d['local_hit'], d['hit'], d['miss'], d['stale'], ratio,
+                fill, size, d['invalidation']))
+
+        if options['reset']:
+            sink.reset(names)
@@ -0,0 +1,51 @@
+# -*- coding: UTF-8 -*-
+from django import db
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from microblog import models
+
+from optparse import make_option
+import time
+
+class Command(BaseCommand):
+    help = "run the pending outbound jobs (tweets, emails)"
+    option_list = BaseCommand.option_list + (
+        make_option('--loop',
+            action='store_true',
+            dest='loop',
+            default=False,
+            help='keep polling for new jobs instead of exiting'),
+        make_option('--sleep',
+            action='store',
+            dest='sleep',
+            type='int',
+            default=10,
+            help='seconds between two polls when there are no jobs'),
+        make_option('--limit',
+            action='store',
+            dest='limit',
+            type='int',
+            default=100,
+            help='jobs reserved at every poll'),
+        )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        while True:
+            jobs = models.OutboundJob.objects.claim(options['limit'])
+            for job in jobs:
+                ok = job.run()
+                if verbosity > 1 or not ok:
+                    self.stdout.write('%s %s: %s\n' % (
+                        job.method, job.content_id, 'ok' if ok else job.last_error))
+            # in un processo di lunga durata la lista delle query eseguite
+            # (con DEBUG attivo) crescerebbe all'infinito
+            db.reset_queries()
+            # chiudo la transazione aperta dalle letture, altrimenti con un
+            # isolamento repeatable read non vedrei i nuovi job
+            transaction.commit_unless_managed()
+            if not options['loop']:
+                break
+            if len(jobs) < options['limit']:
+                time.sleep(options['sleep'])
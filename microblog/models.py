@@ -2,18 +2,26 @@
 from django.conf import settings as dsettings
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.cache import cache
+from django.core.urlresolvers import get_resolver, get_script_prefix, reverse
 from django.db import models
 from django.db.models.query import QuerySet
 from django.db.models.signals import post_save
 from django.template import Template, Context
+from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode, iri_to_uri
 from django.utils.importlib import import_module
+from django.utils.translation import get_language
 
 from taggit.managers import TaggableManager
 
 from microblog import settings
 from microblog.django_urls import UrlMixin
 
+from datetime import datetime, timedelta
+import hashlib
 import logging
+import re
 
 log = logging.getLogger('microblog')
 
@@ -38,9 +46,12 @@ class PostManager(models.Manager):
 
     class _QuerySet(QuerySet):
         def byLanguage(self, lang):
+            # le due condizioni nella stessa filter() si riferiscono alla
+            # stessa riga di PostContent: una sola join, senza sottoquery,
+            # servita dall'indice (language, headline, post_id) creato dalla
+            # migrazione 0009
             return self\
-                .filter(postcontent__language=lang)\
-                .exclude(id__in=Post.objects.filter(postcontent__language=lang, postcontent__headline=''))
+                .filter(postcontent__language=lang, postcontent__headline__gt='')
 
         def byFeatured(self, featured):
             return self.filter(featured=featured)
@@ -48,6 +59,28 @@ class PostManager(models.Manager):
         def published(self):
             return self.filter(status='P')
 
+        def with_contents(self):
+            """
+            I post restituiti avranno già caricati (con un'unica query) i
+            loro PostContent, vedi Post.attach_contents.
+            """
+            qs = self._clone()
+            qs._with_contents = True
+            return qs
+
+        def _clone(self, *args, **kwargs):
+            qs = super(PostManager._QuerySet, self)._clone(*args, **kwargs)
+            qs._with_contents = getattr(self, '_with_contents', False)
+            return qs
+
+        def iterator(self):
+            posts = super(PostManager._QuerySet, self).iterator()
+            if not getattr(self, '_with_contents', False):
+                return posts
+            posts = list(posts)
+            Post.attach_contents(posts)
+            return iter(posts)
+
 class Post(models.Model, UrlMixin):
     date = models.DateTimeField(db_index=True)
     author = models.ForeignKey(User)
@@ -56,6 +89,7 @@ class Post(models.Model, UrlMixin):
     category = models.ForeignKey(Category)
     featured = models.BooleanField(default=False)
     image = models.URLField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
 
     tags = TaggableManager()
 
@@ -80,7 +114,43 @@ class Post(models.Model, UrlMixin):
         esistente, se non esiste neanche questo viene sollevata l'eccezione
         ObjectDoesNotExist.
         """
-        contents = dict((c.language, c) for c in self.postcontent_set.exclude(headline=''))
+        return Post.select_content(self.contents(), lang, fallback)
+
+    def contents(self):
+        """
+        Ritorna un dizionario lingua -> PostContent con i contenuti che
+        hanno un titolo; se sono stati caricati con attach_contents non
+        vengono eseguite query.
+        """
+        try:
+            return self._contents
+        except AttributeError:
+            return dict((c.language, c) for c in self.postcontent_set.exclude(headline=''))
+
+    @staticmethod
+    def attach_contents(posts):
+        """
+        Carica con un'unica query i PostContent di tutti i `posts`; le
+        successive chiamate a content() e contents() non accederanno al db.
+        """
+        posts = dict((p.id, p) for p in posts)
+        for p in posts.values():
+            p._contents = {}
+        if not posts:
+            return
+        for c in PostContent.objects.filter(post__in=posts.keys()).exclude(headline=''):
+            p = posts[c.post_id]
+            # evita una query a chi chiede c.post
+            c._post_cache = p
+            p._contents[c.language] = c
+
+    @staticmethod
+    def select_content(contents, lang, fallback=True):
+        """
+        Sceglie, tra i PostContent passati come dizionario lingua -> content,
+        quello da utilizzare per la lingua `lang` con le stesse regole di
+        `content`.
+        """
         if not contents:
             raise PostContent.DoesNotExist()
         try:
@@ -106,17 +176,64 @@ class Post(models.Model, UrlMixin):
         avere avere una url che identifica un post senza dover per forza
         passare da una traduzione.
         """
-        from dataaccess import post_data
-        # utilizzo dataaccess per evitare di fare una query ogni volta solo per
-        # recuperare il postcontent e chiedere a lui la url
-        data = post_data(self.id, settings.MICROBLOG_DEFAULT_LANGUAGE)
-        return data['url']
+        # per la url servono solo lo slug del contenuto nella lingua di
+        # default e la data o la categoria del post; se i contenuti non sono
+        # già stati caricati li recupero con una query minimale
+        category = None
+        try:
+            slugs = dict((l, c.slug) for l, c in self._contents.items())
+        except AttributeError:
+            rows = PostContent.objects\
+                .filter(post=self.id)\
+                .exclude(headline='')
+            if settings.MICROBLOG_URL_STYLE == 'category':
+                rows = list(rows.values_list('language', 'slug', 'post__category__name'))
+                if rows:
+                    category = rows[0][2]
+            else:
+                rows = rows.values_list('language', 'slug')
+            slugs = dict((r[0], r[1]) for r in rows)
+        slug = Post.select_content(slugs, settings.MICROBLOG_DEFAULT_LANGUAGE)
+        if category is None and settings.MICROBLOG_URL_STYLE == 'category':
+            category = self.category.name
+        return permalink(self.date, category, slug)
 
     get_url_path = get_absolute_url
 
     def spammed(self, method, value):
         return self.spam_set.filter(method=method, value=value).count() > 0
 
+def author_slug(user):
+    """
+    Restituisce lo slug usato nelle url della pagina dell'autore `user`.
+    """
+    return slugify('%s-%s' % (user.first_name, user.last_name))
+
+class AuthorSlug(models.Model):
+    """
+    Lo slug di ogni utente, indicizzato per rendere la ricerca dell'autore
+    una singola query; viene aggiornato al salvataggio dell'utente.
+    """
+    user = models.OneToOneField(User, related_name='microblog_slug')
+    slug = models.SlugField(max_length=100)
+
+    def __unicode__(self):
+        return self.slug
+
+def update_author_slug(sender, instance, **kwargs):
+    slug = author_slug(instance)
+    try:
+        o = AuthorSlug.objects.get(user=instance)
+    except AuthorSlug.DoesNotExist:
+        o = AuthorSlug(user=instance)
+    if o.id and o.slug == slug:
+        return
+    # serve a dataaccess per invalidare anche il vecchio slug
+    o._old_slug = o.slug
+    o.slug = slug
+    o.save()
+post_save.connect(update_author_slug, sender=User)
+
 SPAM_METHODS = (
     ('e', 'email'),
     ('t', 'twitter'),
@@ -134,6 +251,91 @@ class Spam(models.Model):
     def __unicode__(self):
         return '%s -> %s' % (self.method, self.value)
 
+class OutboundJobManager(models.Manager):
+    def enqueue(self, content, method):
+        """
+        Accoda l'invio di `content` con il metodo `method` (vedi
+        SPAM_METHODS), a meno che non ci sia già un job in attesa per lo
+        stesso contenuto.
+        """
+        pending = self.filter(
+            content=content,
+            method=method,
+            attempts__lt=settings.MICROBLOG_OUTBOUND_MAX_ATTEMPTS)
+        if pending.exists():
+            return None
+        return self.create(content=content, method=method, run_after=datetime.now())
+
+    def claim(self, limit=None):
+        """
+        Riserva per MICROBLOG_OUTBOUND_LEASE secondi i job da eseguire e li
+        restituisce; la riserva è un update condizionato sul valore di
+        run_after letto, quindi più worker possono lavorare in parallelo
+        senza eseguire due volte lo stesso job.
+        """
+        now = datetime.now()
+        lease = now + timedelta(seconds=settings.MICROBLOG_OUTBOUND_LEASE)
+        jobs = self\
+            .filter(run_after__lte=now, attempts__lt=settings.MICROBLOG_OUTBOUND_MAX_ATTEMPTS)\
+            .select_related('content', 'content__post')\
+            .order_by('run_after')
+        if limit:
+            jobs = jobs[:limit]
+        output = []
+        for job in jobs:
+            if self.filter(id=job.id, run_after=job.run_after).update(run_after=lease):
+                job.run_after = lease
+                output.append(job)
+        return output
+
+# method -> funzione che pubblicizza un PostContent, registrate dalle
+# integrazioni abilitate (twitter, email)
+outbound_handlers = {}
+
+class OutboundJob(models.Model):
+    """
+    Un invio (tweet, email) in attesa di essere eseguito dal comando
+    microblog_outbound; i job falliti vengono ritentati con un ritardo
+    crescente fino a MICROBLOG_OUTBOUND_MAX_ATTEMPTS tentativi.
+
+    Gli invii già effettuati sono registrati come Spam, ripetere un job non
+    raggiunge due volte lo stesso destinatario.
+    """
+    content = models.ForeignKey('PostContent')
+    method = models.CharField(max_length=1, choices=SPAM_METHODS)
+    created = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = OutboundJobManager()
+
+    def __unicode__(self):
+        return '%s -> %s' % (self.method, self.content_id)
+
+    def run(self):
+        """
+        Esegue il job; se l'invio riesce il job viene cancellato, altrimenti
+        viene riprogrammato. Restituisce True se l'invio è riuscito.
+        """
+        try:
+            outbound_handlers[self.method](self.content)
+        except Exception, e:
+            log.exception('outbound job %s failed', self.id)
+            self.attempts += 1
+            self.last_error = str(e)
+            if self.attempts >= settings.MICROBLOG_OUTBOUND_MAX_ATTEMPTS:
+                message = 'Post: "%s"\n\nGiving up after %d attempts: "%s"' % (
+                    self.content.headline, self.attempts, self.last_error)
+                mail.mail_admins('[blog] error publicizing the post', message)
+            else:
+                delay = settings.MICROBLOG_OUTBOUND_RETRY_DELAY * 2 ** (self.attempts - 1)
+                self.run_after = datetime.now() + timedelta(seconds=delay)
+            self.save()
+            return False
+        self.delete()
+        return True
+
 class PostContentManager(models.Manager):
     def get_query_set(self):
         return self._QuerySet(self.model)
@@ -171,32 +373,59 @@ class PostContent(models.Model, UrlMixin):
     slug = models.SlugField(unique_for_date = 'post.date')
     summary = models.TextField()
     body = models.TextField()
+    modified = models.DateTimeField(auto_now=True)
 
     objects = PostContentManager()
 
+    @property
+    def has_body(self):
+        return bool(self.body)
+
     @classmethod
     def build_absolute_url(cls, post, content):
         if settings.MICROBLOG_URL_STYLE == 'date':
-            date = post.date
+            return cls.url_args(post.date, None, content.slug)
+        elif settings.MICROBLOG_URL_STYLE == 'category':
+            return cls.url_args(None, post.category.name, content.slug)
+
+    @staticmethod
+    def url_args(date, category, slug):
+        """
+        Argomenti per reverse() della url di un post; a seconda di
+        MICROBLOG_URL_STYLE viene usata la data o la categoria.
+        """
+        if settings.MICROBLOG_URL_STYLE == 'date':
             return ('microblog-post-detail', (), {
                 'year': str(date.year),
                 'month': str(date.month).zfill(2),
                 'day': str(date.day).zfill(2),
-                'slug': content.slug
+                'slug': slug
             })
         elif settings.MICROBLOG_URL_STYLE == 'category':
             return ('microblog-post-detail', (), {
-                'category': post.category.name,
-                'slug': content.slug
+                'category': category,
+                'slug': slug
             })
 
-    @models.permalink
     def get_absolute_url(self):
         # è molto brutto che una cosa apparantemente innocua come la
         # costruzione della url richieda una query verso il db; per minimizzare
         # gli effetti faccio cache a livello di istanza
         if not hasattr(self, '_url'):
-            self._url = PostContent.build_absolute_url(self.post, self)
+            post = self.post
+            if settings.MICROBLOG_URL_STYLE == 'category':
+                try:
+                    category = post._category_cache.name
+                except AttributeError:
+                    # la mappa in cache può non conoscere ancora una
+                    # categoria appena creata
+                    from dataaccess import category_names
+                    category = category_names().get(post.category_id)
+                    if category is None:
+                        category = post.category.name
+                self._url = post_url_path(None, category, self.slug)
+            else:
+                self._url = post_url_path(post.date, None, self.slug)
         return self._url
 
     get_url_path = get_absolute_url
@@ -211,6 +440,75 @@ class PostContent(models.Model, UrlMixin):
         tb.save()
         return tb
 
+class UrlFormatter(object):
+    """
+    Costruisce le url di una view senza passare ogni volta da reverse(): la
+    stringa di formato corrispondente al nome della url viene estratta, una
+    volta sola per lingua, dal resolver dell'URLconf.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._formats = {}
+
+    def compile(self):
+        resolver = get_resolver(None)
+        formats = {}
+        for possibility, pattern, defaults in resolver.reverse_dict.getlist(self.name):
+            regex = re.compile(u'^%s' % pattern, re.UNICODE)
+            for result, params in possibility:
+                formats.setdefault(frozenset(params), (result, regex))
+        return formats
+
+    def path(self, kwargs):
+        lang = get_language()
+        try:
+            formats = self._formats[lang]
+        except KeyError:
+            formats = self._formats[lang] = self.compile()
+        try:
+            fmt, regex = formats[frozenset(kwargs)]
+        except KeyError:
+            return reverse(self.name, kwargs=kwargs)
+        candidate = fmt % dict((k, force_unicode(v)) for k, v in kwargs.items())
+        if not regex.search(candidate):
+            # come reverse(), gli argomenti devono corrispondere al pattern
+            # (ad esempio una categoria con uno "/" nel nome): lascio a
+            # reverse() la scelta tra gli altri pattern o il NoReverseMatch
+            return reverse(self.name, kwargs=kwargs)
+        return iri_to_uri(get_script_prefix() + candidate)
+
+_post_url = UrlFormatter('microblog-post-detail')
+
+def post_url_path(date, category, slug):
+    """
+    Restituisce il path della url di un post.
+    """
+    name, args, kwargs = PostContent.url_args(date, category, slug)
+    return _post_url.path(kwargs)
+
+_permalinks = {}
+_PERMALINKS_MAX = 10000
+def permalink(date, category, slug):
+    """
+    Restituisce la url assoluta di un post; il path viene memorizzato in
+    modo da non ripetere la costruzione per gli stessi argomenti.
+    """
+    # come in UrlFormatter il path dipende dalla lingua attiva (e dal
+    # prefisso dello script), il DEFAULT_URL_PREFIX invece viene aggiunto
+    # ad ogni chiamata
+    if settings.MICROBLOG_URL_STYLE == 'date':
+        k = (get_language(), get_script_prefix(), date.date(), slug)
+    else:
+        k = (get_language(), get_script_prefix(), category, slug)
+    try:
+        path = _permalinks[k]
+    except KeyError:
+        path = post_url_path(date, category, slug)
+        if len(_permalinks) >= _PERMALINKS_MAX:
+            _permalinks.clear()
+        _permalinks[k] = path
+    return dsettings.DEFAULT_URL_PREFIX + path
+
 class Trackback(models.Model):
     content = models.ForeignKey(PostContent)
     type = models.CharField(max_length = 2, default = 'tb')
@@ -238,12 +536,23 @@ if settings.MICROBLOG_TWITTER_INTEGRATION:
         return headline + "..."
 
     _twitter_template = Template(settings.MICROBLOG_TWITTER_MESSAGE_TEMPLATE)
-    def post_update_on_twitter(sender, instance, created, **kwargs):
+    def _twitter_wanted(instance):
         if settings.MICROBLOG_TWITTER_LANGUAGES is not None and instance.language not in settings.MICROBLOG_TWITTER_LANGUAGES:
+            return False
+        return instance.post.is_published()
+
+    def _twitter_recipients(post):
+        existent = set(( x.value for x in Spam.objects.filter(post=post, method='t') ))
+        return set((settings.MICROBLOG_TWITTER_USERNAME,)) - existent
+
+    def tweet_content(instance):
+        """
+        Pubblica su twitter `instance`, se non è già stato fatto; solleva
+        un'eccezione se la pubblicazione non riesce.
+        """
+        if not _twitter_wanted(instance):
             return
         post = instance.post
-        if not post.is_published():
-            return
 
         try:
             if not isinstance(settings.MICROBLOG_TWITTER_POST_URL_MANGLER, str):
@@ -253,12 +562,9 @@ if settings.MICROBLOG_TWITTER_INTEGRATION:
                 mod = import_module(module)
                 url = getattr(mod, attr)(instance)
         except Exception, e:
-            message = 'Post: "%s"\n\nCannot retrieve the url: "%s"' % (instance.headline, str(e))
-            mail.mail_admins('[blog] error preparing the tweet', message)
-            return
+            raise Exception('Cannot retrieve the url: "%s"' % str(e))
 
-        existent = set(( x.value for x in Spam.objects.filter(post=post, method='t') ))
-        recipients = set((settings.MICROBLOG_TWITTER_USERNAME,)) - existent
+        recipients = _twitter_recipients(post)
         if not recipients:
             return
 
@@ -285,12 +591,24 @@ if settings.MICROBLOG_TWITTER_INTEGRATION:
         try:
             api = twitter.Api(settings.MICROBLOG_TWITTER_USERNAME, settings.MICROBLOG_TWITTER_PASSWORD)
             api.PostUpdate(status)
-            s = Spam(post=post, method='t', value=settings.MICROBLOG_TWITTER_USERNAME)
-            s.save()
         except Exception, e:
-            message = 'Post: "%s"\n\nCannot post status update: "%s"' % (instance.headline, str(e))
-            mail.mail_admins('[blog] error tweeting the new status', message)
+            raise Exception('Cannot post status update: "%s"' % str(e))
+        s = Spam(post=post, method='t', value=settings.MICROBLOG_TWITTER_USERNAME)
+        s.save()
+    outbound_handlers['t'] = tweet_content
+
+    def post_update_on_twitter(sender, instance, created, **kwargs):
+        if not _twitter_wanted(instance):
+            return
+        if settings.MICROBLOG_OUTBOUND_QUEUE:
+            if _twitter_recipients(instance.post):
+                OutboundJob.objects.enqueue(instance, 't')
             return
+        try:
+            tweet_content(instance)
+        except Exception, e:
+            message = 'Post: "%s"\n\n%s' % (instance.headline, str(e))
+            mail.mail_admins('[blog] error tweeting the new status', message)
 
     post_save.connect(post_update_on_twitter, sender=PostContent)
 
@@ -299,18 +617,28 @@ if settings.MICROBLOG_EMAIL_INTEGRATION:
         'subject': Template(settings.MICROBLOG_EMAIL_SUBJECT_TEMPLATE),
         'body': Template(settings.MICROBLOG_EMAIL_BODY_TEMPLATE),
     }
-    def post_update_on_email(sender, instance, created, **kwargs):
+    def _email_wanted(instance):
         if settings.MICROBLOG_EMAIL_LANGUAGES is not None and instance.language not in settings.MICROBLOG_EMAIL_LANGUAGES:
-            return
-        post = instance.post
-        if not post.is_published():
-            return
+            return False
+        return instance.post.is_published()
 
+    def _email_recipients(post):
         existent = set(( x.value for x in Spam.objects.filter(post=post, method='e') ))
-        recipients = set(settings.MICROBLOG_EMAIL_RECIPIENTS) - existent
-        if not recipients:
-            return
+        return set(settings.MICROBLOG_EMAIL_RECIPIENTS) - existent
 
+    from microblog.utils import HtmlToText
+    _email_to_text = HtmlToText(ignore_images=True)
+
+    # il risultato dipende solo dal documento, può restare in cache a lungo
+    _EMAIL_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+    def render_email(instance):
+        """
+        Restituisce soggetto, versione html e versione testo dell'email per
+        `instance`. La pulizia dell'html e la conversione in testo vengono
+        messe in cache usando come chiave l'hash del documento renderizzato,
+        quindi sono condivise tra i blocchi di destinatari, i tentativi e i
+        contenuti identici.
+        """
         ctx = Context({
             'content': instance,
         })
@@ -319,12 +647,18 @@ if settings.MICROBLOG_EMAIL_INTEGRATION:
         from lxml.html.clean import clean_html
 
         subject = strip_tags(_email_templates['subject'].render(ctx))
+        source = _email_templates['body'].render(ctx)
+        k = 'm:email:%s' % hashlib.md5(
+            (dsettings.DEFAULT_URL_PREFIX + source).encode('utf-8')).hexdigest()
+        bodies = cache.get(k)
+        if bodies is not None:
+            return (subject,) + bodies
+
         try:
-            hdoc = html.fromstring(_email_templates['body'].render(ctx))
+            hdoc = html.fromstring(source)
         except Exception, e:
-            message = 'Post: "%s"\n\nCannot parse as html: "%s"' % (subject, str(e))
-            mail.mail_admins('[blog] error while sending mail', message)
-            return
+            raise Exception('Cannot parse as html: "%s"' % str(e))
+
         # dalla doc di lxml:
         # The module lxml.html.clean provides a Cleaner class for cleaning up
         # HTML pages. It supports removing embedded or script content, special
@@ -345,19 +679,66 @@ if settings.MICROBLOG_EMAIL_INTEGRATION:
 
         # per i client di posta che non supportano l'html ecco una versione in
         # solo testo
-        import html2text
-        x = html2text.IGNORE_IMAGES
-        html2text.IGNORE_IMAGES = True
-        body_text = html2text.html2text(body_html)
-        html2text.IGNORE_IMAGES = x
-
-        for r in recipients:
-            log.info('"%s" email to "%s"', instance.headline.encode('utf-8'), r)
-            email = mail.EmailMultiAlternatives(subject, body_text, dsettings.DEFAULT_FROM_EMAIL, [r])
-            email.attach_alternative(body_html, 'text/html')
-            email.send()
-            s = Spam(post=post, method='e', value=r)
-            s.save()
+        body_text = _email_to_text(body_html)
+
+        bodies = (body_html, body_text)
+        cache.set(k, bodies, _EMAIL_CACHE_TIMEOUT)
+        return (subject,) + bodies
+
+    def email_content(instance):
+        """
+        Invia `instance` ai MICROBLOG_EMAIL_RECIPIENTS che non l'hanno
+        ancora ricevuto; solleva un'eccezione se l'invio non riesce.
+        """
+        if not _email_wanted(instance):
+            return
+        post = instance.post
+
+        recipients = _email_recipients(post)
+        if not recipients:
+            return
+
+        subject, body_html, body_text = render_email(instance)
+
+        # una sola connessione per tutti gli invii; ogni email viene spedita
+        # singolarmente e i destinatari raggiunti vengono registrati come
+        # Spam a blocchi, anche se un invio fallisce: ritentando il job non
+        # riceveranno una seconda copia
+        recipients = sorted(recipients)
+        size = settings.MICROBLOG_EMAIL_BATCH_SIZE
+        connection = mail.get_connection()
+        connection.open()
+        try:
+            for ix in range(0, len(recipients), size):
+                sent = []
+                try:
+                    for r in recipients[ix:ix + size]:
+                        log.info('"%s" email to "%s"', instance.headline.encode('utf-8'), r)
+                        email = mail.EmailMultiAlternatives(
+                            subject, body_text, dsettings.DEFAULT_FROM_EMAIL, [r],
+                            connection=connection)
+                        email.attach_alternative(body_html, 'text/html')
+                        if connection.send_messages([email]):
+                            sent.append(r)
+                finally:
+                    if sent:
+                        Spam.objects.bulk_create([ Spam(post=post, method='e', value=r) for r in sent ])
+        finally:
+            connection.close()
+    outbound_handlers['e'] = email_content
+
+    def post_update_on_email(sender, instance, created, **kwargs):
+        if not _email_wanted(instance):
+            return
+        if settings.MICROBLOG_OUTBOUND_QUEUE:
+            if _email_recipients(instance.post):
+                OutboundJob.objects.enqueue(instance, 'e')
+            return
+        try:
+            email_content(instance)
+        except Exception, e:
+            message = 'Post: "%s"\n\n%s' % (instance.headline, str(e))
+            mail.mail_admins('[blog] error while sending mail', message)
     post_save.connect(post_update_on_email, sender=PostContent)
 
 import moderation
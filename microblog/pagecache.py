@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+"""
+Cache delle pagine del blog servite agli utenti anonimi.
+
+Le chiavi includono path, lingua e la generazione (vedi
+dataaccess.generations) dei namespace da cui la pagina dipende:
+    m:pages:lists       tutte le liste di post
+    m:pages:path:<path> la pagina di dettaglio di un post
+e i segnali di salvataggio dei modelli invalidano solo i namespace
+coinvolti.
+
+Il decoratore `conditional` risponde alle richieste condizionali
+(If-None-Match) usando come validatore il marcatore
+dataaccess.last_changed, senza eseguire la view.
+"""
+from django.contrib import comments
+from django.core.cache import cache
+from django.core.urlresolvers import NoReverseMatch
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.views.decorators.http import condition
+
+from microblog import dataaccess, models, settings
+
+from taggit.models import Tag, TaggedItem
+
+import functools
+
+LISTS = 'm:pages:lists'
+
+def path_namespace(path):
+    # il pattern delle url dei post accetta lo slash finale opzionale
+    return 'm:pages:path:%s' % path.rstrip('/')
+
+def page_cache(namespaces):
+    """
+    Decoratore per le view; `namespaces` riceve gli stessi argomenti della
+    view e restituisce i namespace da cui dipende la pagina.
+
+    Vengono messe in cache solo le risposte 200 a richieste GET/HEAD di
+    utenti anonimi che non hanno utilizzato il token CSRF (che è diverso per
+    ogni browser).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.MICROBLOG_PAGE_CACHE \
+                or request.method not in ('GET', 'HEAD') \
+                or request.user.is_authenticated():
+                return view(request, *args, **kwargs)
+
+            nss = namespaces(request, *args, **kwargs)
+            gens = dataaccess.generations(nss)
+            k = 'm:page:%s:%s:%s' % (
+                getattr(request, 'LANGUAGE_CODE', ''),
+                request.get_full_path(),
+                ':'.join(str(gens[n]) for n in nss))
+            hk = dataaccess.hashme(k)
+            response = cache.get(hk)
+            if response is None:
+                with dataaccess.track_staleness() as staleness:
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200 \
+                    or request.META.get('CSRF_COOKIE_USED') \
+                    or response.cookies:
+                    return response
+                # una pagina generata a partire da dati non aggiornati (ad
+                # esempio mentre un altro processo ricostruisce l'indice dei
+                # post) resta in cache solo finché lo sono quei dati
+                timeout = settings.MICROBLOG_PAGE_CACHE_TIMEOUT
+                if staleness.window:
+                    timeout = min(timeout, staleness.window)
+                cache.set(hk, response, timeout)
+            return response
+        return wrapper
+    return decorator
+
+def request_language(request, *args, **kwargs):
+    # i contenuti usano il codice della lingua senza la variante ('en' e
+    # non 'en-us'), come _lang dei templatetag
+    l = getattr(request, 'LANGUAGE_CODE', settings.MICROBLOG_DEFAULT_LANGUAGE)
+    return l.split('-', 1)[0]
+
+def any_language(request, *args, **kwargs):
+    # il dettaglio di un post può mostrare un contenuto in una lingua diversa
+    # da quella della richiesta
+    return None
+
+def conditional(language=request_language):
+    """
+    Decoratore per le view che aggiunge l'ETag e risponde 304
+    alle richieste condizionali; `language` riceve gli stessi argomenti della
+    view e restituisce la lingua dei contenuti mostrati.
+
+    Il validatore è il marcatore dataaccess.last_changed: è grossolano (una
+    modifica qualsiasi invalida tutte le pagine di una lingua) ma costa una
+    sola lettura dalla cache. Gli utenti autenticati vedono anche le bozze,
+    per loro non viene calcolato.
+
+    Non viene aggiunto Last-Modified: il marcatore ha una risoluzione
+    inferiore al secondo, due modifiche nello stesso secondo produrrebbero
+    la stessa data e un 304 errato per chi invia solo If-Modified-Since.
+    """
+    def etag(request, *args, **kwargs):
+        if request.user.is_authenticated():
+            return None
+        l = language(request, *args, **kwargs)
+        return '%s-%r' % (l, dataaccess.last_changed(l))
+    deco = condition(etag_func=etag)
+    def decorator(view):
+        cview = deco(view)
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.MICROBLOG_CONDITIONAL_GET:
+                return view(request, *args, **kwargs)
+            return cview(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def lists(request, *args, **kwargs):
+    return [LISTS]
+
+def detail(request, *args, **kwargs):
+    return [LISTS, path_namespace(request.path)]
+
+def _content_path(content):
+    # l'admin salva anche i contenuti vuoti delle lingue non tradotte, per
+    # questi (non pubblicati) non esiste una url
+    if not content.headline:
+        return None
+    try:
+        return path_namespace(content.get_absolute_url())
+    except NoReverseMatch:
+        return None
+
+def _post_paths(pid):
+    contents = models.PostContent.objects\
+        .filter(post=pid)\
+        .exclude(headline='')\
+        .select_related('post')
+    return filter(None, map(_content_path, contents))
+
+def _content_paths(cid):
+    try:
+        content = models.PostContent.objects.select_related('post').get(id=cid)
+    except models.PostContent.DoesNotExist:
+        return []
+    return filter(None, [_content_path(content)])
+
+def stash_paths(sender, instance, **kwargs):
+    # un post (o un suo contenuto) modificato o cancellato può cambiare
+    # url, le pagine da invalidare sono anche quelle con la url precedente
+    if instance.id is None:
+        instance._page_paths = []
+    elif sender is models.Post:
+        instance._page_paths = _post_paths(instance.id)
+    else:
+        instance._page_paths = _content_paths(instance.id)
+
+def invalidate(sender, **kwargs):
+    o = kwargs['instance']
+    saved = 'created' in kwargs
+    nss = []
+    if sender in (Tag, TaggedItem, models.Category):
+        nss.append(LISTS)
+    elif sender is models.Post:
+        nss.append(LISTS)
+        nss.extend(getattr(o, '_page_paths', []))
+        if saved:
+            nss.extend(_post_paths(o.id))
+    elif sender is models.PostContent:
+        nss.append(LISTS)
+        nss.extend(getattr(o, '_page_paths', []))
+        if saved:
+            nss.extend(_content_paths(o.id))
+    elif sender is comments.get_model():
+        if o.content_type.app_label == 'microblog' and o.content_type.model == 'post':
+            nss.append(LISTS)
+            nss.extend(_post_paths(o.object_pk))
+    elif sender is models.Trackback:
+        nss.extend(_content_paths(o.content_id))
+    else:
+        # pingback
+        nss.extend(_content_paths(o.object_id))
+    if nss:
+        dataaccess.invalidate_namespaces(set(nss))
+
+_senders = [
+    models.Post, models.PostContent, models.Category, models.Trackback,
+    comments.get_model(), Tag, TaggedItem,
+]
+if settings.MICROBLOG_PINGBACK_SERVER:
+    from pingback.models import Pingback
+    _senders.append(Pingback)
+
+if settings.MICROBLOG_PAGE_CACHE:
+    for m in _senders:
+        post_save.connect(invalidate, sender=m, weak=False)
+        post_delete.connect(invalidate, sender=m, weak=False)
+    for m in (models.Post, models.PostContent):
+        pre_save.connect(stash_paths, sender=m, weak=False)
+        pre_delete.connect(stash_paths, sender=m, weak=False)
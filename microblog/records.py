@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+"""
+Rappresentazioni compatte, e facilmente serializzabili, dei modelli usati
+dai template; vengono salvate in cache da dataaccess al posto delle istanze
+dei modelli django, che oltre ai campi si portano dietro lo stato interno e
+le cache delle relazioni.
+
+Ogni modifica alla struttura dei record deve incrementare VERSION, che fa
+parte delle chiavi di cache; in questo modo versioni diverse del codice non
+leggono record incompatibili.
+
+I record espongono anche i metodi dei modelli usati più spesso nei template
+(get_absolute_url, user_name, ...) in modo che i tag pubblici che li
+restituiscono (post_tags, get_post_data, get_post_comment) restino
+compatibili con i template esistenti; quello che non è disponibile è il
+body di ContentRecord e le relazioni non memorizzate (ad esempio
+content.post o comment.user).
+"""
+from django.core.urlresolvers import reverse
+
+VERSION = 3
+
+class Record(object):
+    """
+    Classe base dei record: gli attributi sono elencati in __slots__ e la
+    serializzazione si limita ai loro valori.
+    """
+    __slots__ = ()
+
+    def __init__(self, *args):
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        return (self.__class__, self._values())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self._values())
+
+class AuthorRecord(Record):
+    __slots__ = ('id', 'username', 'first_name', 'last_name')
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.first_name, user.last_name)
+
+    def get_full_name(self):
+        return (u'%s %s' % (self.first_name, self.last_name)).strip()
+
+    def __unicode__(self):
+        return self.username
+
+class CategoryRecord(Record):
+    __slots__ = ('id', 'name')
+
+    @classmethod
+    def from_category(cls, category):
+        return cls(category.id, category.name)
+
+    def __unicode__(self):
+        return self.name
+
+class PostRecord(Record):
+    """
+    url è quella restituita da Post.get_absolute_url, None se il post non ha
+    contenuti.
+    """
+    __slots__ = ('id', 'date', 'status', 'featured', 'image', 'allow_comments', 'author', 'category', 'url')
+
+    @classmethod
+    def from_post(cls, post, url):
+        return cls(
+            post.id, post.date, post.status, post.featured, post.image,
+            post.allow_comments,
+            AuthorRecord.from_user(post.author),
+            CategoryRecord.from_category(post.category),
+            url)
+
+    def is_published(self):
+        return self.status == 'P'
+
+    def get_absolute_url(self):
+        return self.url
+
+    def get_trackback_url(self):
+        return self.url + '/trackback'
+
+class ContentRecord(Record):
+    """
+    Il body, che i template delle liste non mostrano, viene sostituito dal
+    flag has_body; come per PostContent get_absolute_url restituisce il path
+    della url mentre permalink è la url assoluta.
+    """
+    __slots__ = ('id', 'post_id', 'language', 'headline', 'slug', 'summary', 'has_body', 'path', 'permalink')
+
+    @classmethod
+    def from_content(cls, content, path, permalink):
+        return cls(
+            content.id, content.post_id, content.language, content.headline,
+            content.slug, content.summary, bool(content.body), path, permalink)
+
+    def get_absolute_url(self):
+        return self.path
+
+    def __unicode__(self):
+        return self.headline
+
+class CommentRecord(Record):
+    """
+    Vengono memorizzati solo i commenti pubblici, per questo is_public è
+    sempre True.
+    """
+    __slots__ = ('id', 'submit_date', 'comment', 'name', 'email', 'url', 'user_id')
+
+    is_public = True
+
+    @classmethod
+    def from_comment(cls, comment):
+        info = comment.userinfo
+        return cls(
+            comment.id, comment.submit_date, comment.comment,
+            info.get('name', ''), info.get('email', ''), info.get('url', ''),
+            comment.user_id)
+
+    @property
+    def user_name(self):
+        return self.name
+
+    @property
+    def user_email(self):
+        return self.email
+
+    @property
+    def user_url(self):
+        return self.url
+
+    @property
+    def userinfo(self):
+        return {
+            'name': self.name,
+            'email': self.email,
+            'url': self.url,
+        }
+
+class TagRecord(Record):
+    __slots__ = ('id', 'name', 'slug')
+
+    @classmethod
+    def from_tag(cls, tag):
+        return cls(tag.id, tag.name, tag.slug)
+
+    def get_absolute_url(self):
+        return reverse('microblog-tag', args=[self.name])
+
+    def __unicode__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name.encode('utf-8')
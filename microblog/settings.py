@@ -32,6 +32,14 @@ MICROBLOG_AUTHOR_NAME = getattr(settings, 'MICROBLOG_AUTHOR_NAME', None)
 MICROBLOG_AUTHOR_EMAIL = getattr(settings, 'MICROBLOG_AUTHOR_EMAIL', None)
 MICROBLOG_AUTHOR_LINK = getattr(settings, 'MICROBLOG_AUTHOR_LINK', None)
 
+# number of posts in the feeds
+MICROBLOG_FEED_ITEMS = getattr(settings, 'MICROBLOG_FEED_ITEMS', 10)
+# include the post body in the feed items (otherwise only the summary)
+MICROBLOG_FEED_FULL_CONTENT = getattr(settings, 'MICROBLOG_FEED_FULL_CONTENT', True)
+# the rendered feeds are cached and regenerated only when a published post
+# changes
+MICROBLOG_FEED_CACHE_TIMEOUT = getattr(settings, 'MICROBLOG_FEED_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
 # configure the moderation system:
 # None - moderation disabled
 # light - auto moderate comments after 30 days and sends email 
@@ -64,6 +72,19 @@ MICROBLOG_EMAIL_RECIPIENTS = getattr(settings, 'MICROBLOG_EMAIL_RECIPIENTS', [])
 MICROBLOG_EMAIL_LANGUAGES = getattr(settings, 'MICROBLOG_EMAIL_LANGUAGES', None)
 MICROBLOG_EMAIL_BODY_TEMPLATE = getattr(settings, 'MICROBLOG_EMAIL_BODY_TEMPLATE', '{% if content.summary %}{{ content.summary|safe }}\n{% endif %}{{ content.body|safe }}')
 MICROBLOG_EMAIL_SUBJECT_TEMPLATE = getattr(settings, 'MICROBLOG_EMAIL_SUBJECT_TEMPLATE', '{{ content.headline|safe }}')
+# ... emails sent (and recorded) together over the same SMTP connection
+MICROBLOG_EMAIL_BATCH_SIZE = getattr(settings, 'MICROBLOG_EMAIL_BATCH_SIZE', 100)
+
+# Publicize the posts (twitter, email) from the microblog_outbound command
+# instead of inside the post_save signal; the jobs are stored in the db.
+MICROBLOG_OUTBOUND_QUEUE = getattr(settings, 'MICROBLOG_OUTBOUND_QUEUE', False)
+# ... attempts before giving up on a job (the admins are notified)
+MICROBLOG_OUTBOUND_MAX_ATTEMPTS = getattr(settings, 'MICROBLOG_OUTBOUND_MAX_ATTEMPTS', 5)
+# ... seconds before the first retry, doubled at every failure
+MICROBLOG_OUTBOUND_RETRY_DELAY = getattr(settings, 'MICROBLOG_OUTBOUND_RETRY_DELAY', 60)
+# ... seconds a job is reserved by a worker
+MICROBLOG_OUTBOUND_LEASE = getattr(settings, 'MICROBLOG_OUTBOUND_LEASE', 5 * 60)
+
 # Microblog twitter integration configuration
 
 # Enable Twitter integration
@@ -93,11 +114,52 @@ MICROBLOG_POST_PER_PAGE = getattr(settings, 'MICROBLOG_POST_PER_PAGE', 20)
 if MICROBLOG_POST_LIST_PAGINATION and MICROBLOG_POST_PER_PAGE < 1:
     raise ImproperlyConfigured('MICROBLOG_POST_PER_PAGE must be greater than zero')
 
+# In-process LRU cache used in front of the django cache by the dataaccess
+# functions; 0 disables it.
+MICROBLOG_LOCAL_CACHE_ENTRIES = getattr(settings, 'MICROBLOG_LOCAL_CACHE_ENTRIES', 0)
+# ... approximate upper bound, in bytes, of the memory used by the cache
+MICROBLOG_LOCAL_CACHE_SIZE = getattr(settings, 'MICROBLOG_LOCAL_CACHE_SIZE', 16 * 1024 * 1024)
+# ... seconds an entry is kept; the invalidation signals are received only by
+# the process that saved the object, this bounds the staleness of the others
+MICROBLOG_LOCAL_CACHE_TIMEOUT = getattr(settings, 'MICROBLOG_LOCAL_CACHE_TIMEOUT', 60)
+
+# Seconds after which the lock taken by a process recomputing a cached value
+# is considered abandoned
+MICROBLOG_CACHE_LOCK_TIMEOUT = getattr(settings, 'MICROBLOG_CACHE_LOCK_TIMEOUT', 30)
+
+# Sink for the hit/miss/fill time statistics of the cached dataaccess
+# functions: a dotted path (or a class) or None to disable them.
+#   microblog.stats.MemoryStats - in-memory counters periodically summed in
+#       the django cache, dumped by the microblog_cache_stats command
+#   microblog.stats.StatsdStats - sends the statistics to a StatsD server
+MICROBLOG_CACHE_STATS = getattr(settings, 'MICROBLOG_CACHE_STATS', None)
+# ... fraction of the misses whose serialized size is measured (it costs an
+# extra pickle of the value)
+MICROBLOG_CACHE_STATS_SIZE_SAMPLE = getattr(settings, 'MICROBLOG_CACHE_STATS_SIZE_SAMPLE', 0.01)
+# ... seconds between two flushes of the in-memory counters
+MICROBLOG_CACHE_STATS_FLUSH = getattr(settings, 'MICROBLOG_CACHE_STATS_FLUSH', 60)
+# ... StatsD server
+MICROBLOG_STATSD_HOST = getattr(settings, 'MICROBLOG_STATSD_HOST', 'localhost')
+MICROBLOG_STATSD_PORT = getattr(settings, 'MICROBLOG_STATSD_PORT', 8125)
+MICROBLOG_STATSD_PREFIX = getattr(settings, 'MICROBLOG_STATSD_PREFIX', 'microblog')
+
+# Cache the pages served to anonymous users; the cached pages are purged by
+# the save signals of the models they show.
+MICROBLOG_PAGE_CACHE = getattr(settings, 'MICROBLOG_PAGE_CACHE', False)
+MICROBLOG_PAGE_CACHE_TIMEOUT = getattr(settings, 'MICROBLOG_PAGE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+# Add an ETag to the posts, the lists and the feeds, and answer 304 to
+# conditional requests of anonymous users without rendering anything. The
+# ETag only follows the blog contents: after a change to the templates, the
+# settings or an author's name the clients keep the pages they have until
+# the next content change.
+MICROBLOG_CONDITIONAL_GET = getattr(settings, 'MICROBLOG_CONDITIONAL_GET', False)
+
 MICROBLOG_UPLOAD_TO = getattr(settings, 'MICROBLOG_UPLOAD_TO', 'microblog')
 
-def MICROBLOG_POST_FILTER(posts, user):
+def default_post_filter(posts, user):
     if user and user.is_authenticated():
         return posts
     else:
         return filter(lambda x: x.is_published(), posts)
-MICROBLOG_POST_FILTER = getattr(settings, 'MICROBLOG_POST_FILTER', MICROBLOG_POST_FILTER)
+MICROBLOG_POST_FILTER = getattr(settings, 'MICROBLOG_POST_FILTER', default_post_filter)
@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+"""
+Raccolta delle statistiche sull'uso della cache da parte delle funzioni
+decorate con dataaccess.cache_me.
+
+Le statistiche vengono inviate ad un "sink", un oggetto con il metodo
+`record(name, metric, value)`, scelto tramite MICROBLOG_CACHE_STATS.
+"""
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+from microblog import settings
+
+import threading
+import time
+
+# i contatori non devono scadere, 30 giorni è il massimo timeout relativo di
+# memcached
+TIMEOUT = 30 * 24 * 60 * 60
+
+METRICS = (
+    # valore trovato nella cache locale del processo
+    'local_hit',
+    # valore trovato nella cache di django
+    'hit',
+    # valore non trovato e ricalcolato
+    'miss',
+    # valore invalidato servito mentre un altro processo lo ricalcola
+    'stale',
+    # millisecondi spesi a ricalcolare i valori mancanti
+    'fill_ms',
+    # dimensione, serializzata, dei valori ricalcolati (stimata su un
+    # campione, vedi MICROBLOG_CACHE_STATS_SIZE_SAMPLE)
+    'bytes',
+    # namespace o chiavi invalidate
+    'invalidation',
+)
+
+class MemoryStats(object):
+    """
+    Accumula i contatori in memoria e ogni MICROBLOG_CACHE_STATS_FLUSH
+    secondi li somma a quelli presenti nella cache di django, in modo che
+    siano visibili (dal comando microblog_cache_stats) anche al di fuori del
+    processo che li ha raccolti.
+    """
+    prefix = 'm:stats:'
+
+    def __init__(self):
+        self.counters = {}
+        self.next_flush = time.time() + settings.MICROBLOG_CACHE_STATS_FLUSH
+        self._lock = threading.Lock()
+
+    def key(self, name, metric):
+        return '%s%s:%s' % (self.prefix, name, metric)
+
+    def record(self, name, metric, value=1):
+        with self._lock:
+            k = (name, metric)
+            self.counters[k] = self.counters.get(k, 0) + value
+        if time.time() > self.next_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counters = self.counters
+            self.counters = {}
+            self.next_flush = time.time() + settings.MICROBLOG_CACHE_STATS_FLUSH
+        for (name, metric), value in counters.items():
+            k = self.key(name, metric)
+            value = int(value)
+            try:
+                cache.incr(k, value)
+            except ValueError:
+                if not cache.add(k, value, TIMEOUT):
+                    cache.incr(k, value)
+
+    def read(self, names):
+        """
+        Restituisce un dizionario nome -> {metrica: valore}.
+        """
+        self.flush()
+        keys = dict((self.key(n, m), (n, m)) for n in names for m in METRICS)
+        found = cache.get_many(keys.keys())
+        output = dict((n, dict.fromkeys(METRICS, 0)) for n in names)
+        for k, v in found.items():
+            n, m = keys[k]
+            output[n][m] = v
+        return output
+
+    def reset(self, names):
+        with self._lock:
+            self.counters = {}
+        cache.delete_many([ self.key(n, m) for n in names for m in METRICS ])
+
+class StatsdStats(object):
+    """
+    Invia le statistiche ad un server StatsD (richiede il modulo statsd).
+    """
+    def __init__(self):
+        try:
+            import statsd
+        except ImportError:
+            raise ImproperlyConfigured('In order to use StatsdStats you need the statsd module')
+        self.client = statsd.StatsClient(
+            settings.MICROBLOG_STATSD_HOST,
+            settings.MICROBLOG_STATSD_PORT,
+            prefix=settings.MICROBLOG_STATSD_PREFIX)
+
+    def record(self, name, metric, value=1):
+        k = '%s.%s' % (name, metric)
+        if metric == 'fill_ms':
+            self.client.timing(k, value)
+        else:
+            self.client.incr(k, value)
+
+def get_sink():
+    path = settings.MICROBLOG_CACHE_STATS
+    if not path:
+        return None
+    if not isinstance(path, basestring):
+        return path()
+    module, attr = path.rsplit('.', 1)
+    try:
+        return getattr(import_module(module), attr)()
+    except (ImportError, AttributeError), e:
+        raise ImproperlyConfigured('Cannot load the cache stats sink "%s": %s' % (path, e))
@@ -1,12 +1,10 @@
 # -*- coding: UTF-8 -*-
 import re
-from collections import defaultdict
 from datetime import date
 
 from django import template
 from django.contrib.sites.models import Site
 from django.template import Context
-from django.template.defaultfilters import slugify
 from django.utils.translation import ugettext
 from django.utils.safestring import mark_safe
 
@@ -26,68 +24,82 @@ def _lang(ctx):
     return l.split('-', 1)[0]
 
 @fancy_tag(register, takes_context=True)
-def post_list(context, post_type='any', count=None, year=None, tag=None, category=None, author=None):
-    posts = dataaccess.post_list(_lang(context))
-    posts = settings.MICROBLOG_POST_FILTER(posts, context.get('user'))
-    if post_type == 'featured':
-        posts = filter(lambda x: x.featured, posts)
-    elif post_type == 'non-featured':
-        posts = filter(lambda x: not x.featured, posts)
+def post_list(context, post_type='any', count=None, year=None, month=None, tag=None, category=None, author=None):
+    index = dataaccess.post_index(_lang(context))
+    posts = index['posts']
+    user = context.get('user')
+    postings = []
+    if settings.MICROBLOG_POST_FILTER is settings.default_post_filter:
+        # il filtro di default può essere risolto con l'indice
+        if not (user and user.is_authenticated()):
+            postings.append(index['published'])
+        post_filter = None
+    else:
+        post_filter = settings.MICROBLOG_POST_FILTER
+    if post_type in ('featured', 'non-featured'):
+        postings.append(index[post_type])
     if year is not None:
-        year = int(year)
-        posts = filter(lambda x: x.date.year == year, posts)
+        if month is not None:
+            postings.append(index['month'].get((int(year), int(month)), ()))
+        else:
+            postings.append(index['year'].get(int(year), ()))
     if tag is not None:
-        tagged = dataaccess.tagged_posts(tag)
-        posts = filter(lambda x: x.id in tagged, posts)
+        postings.append(index['tag'].get(tag.lower(), ()))
     if category is not None:
-        posts = filter(lambda x: x.category == category, posts)
+        postings.append(index['category'].get(category.id, ()))
     if author is not None:
-        posts = filter(lambda x: x.author == author, posts)
+        postings.append(index['author'].get(author.id, ()))
+
+    if postings:
+        posts = [ posts[ix] for ix in dataaccess.intersect_postings(postings) ]
+    if post_filter is None:
+        if count is not None:
+            posts = posts[:count]
+        return list(posts)
+    posts = post_filter(posts, user)
     if count is not None:
         posts = posts[:count]
     return posts
 
+def _facets(context):
+    """
+    Conteggi dei post visibili all'utente corrente; con il filtro di default
+    sono quelli precalcolati da dataaccess, altrimenti vengono calcolati a
+    partire dai post filtrati.
+    """
+    if settings.MICROBLOG_POST_FILTER is settings.default_post_filter:
+        user = context.get('user')
+        visibility = 'all' if user and user.is_authenticated() else 'public'
+        return dataaccess.post_facets(_lang(context), visibility)
+    return dataaccess.build_facets(post_list(context), dataaccess.tag_map())
+
 @fancy_tag(register, takes_context=True)
 def year_list(context):
-    posts = post_list(context)
-    years = defaultdict(lambda: 0)
-    for p in posts:
-        years[date(day=1, month=1, year=p.date.year)] += 1
-    return sorted(years.items())
+    years = _facets(context)['years']
+    return sorted((date(day=1, month=1, year=y), n) for y, n in years.items())
 
 @fancy_tag(register, takes_context=True)
 def month_list(context):
-    posts = post_list(context)
-    months = defaultdict(lambda: 0)
-    for p in posts:
-        months[date(day=1, month=p.date.month, year=p.date.year)] += 1
-    return sorted(months.items())
+    months = _facets(context)['months']
+    return sorted((date(day=1, month=m, year=y), n) for (y, m), n in months.items())
 
 @fancy_tag(register, takes_context=True)
 def author_list(context):
-    posts = post_list(context)
-    authors = defaultdict(lambda: 0)
-    for p in posts:
-        authors[p.author] += 1
-    return sorted(authors.items(), key=lambda x: x[0].first_name + x[0].last_name)
+    facets = _facets(context)
+    users = facets['users']
+    authors = [ (users[uid], n) for uid, n in facets['authors'].items() ]
+    return sorted(authors, key=lambda x: x[0].first_name + x[0].last_name)
 
 @fancy_tag(register, takes_context=True)
 def category_list(context):
-    posts = post_list(context)
-    categories = defaultdict(lambda: 0)
-    for p in posts:
-        categories[p.category] += 1
-    return sorted(categories.items(), key=lambda x: x[0].name)
+    facets = _facets(context)
+    objs = facets['category_objs']
+    categories = [ (objs[cid], n) for cid, n in facets['categories'].items() ]
+    return sorted(categories, key=lambda x: x[0].name)
 
 @fancy_tag(register, takes_context=True)
 def tags_list(context):
-    posts = post_list(context)
-    tmap = dataaccess.tag_map()
-    tags = defaultdict(lambda: 0)
-    for p in posts:
-        for t in tmap.get(p.id, []):
-            tags[t.name] += 1
-    return sorted(tags.items())
+    return sorted(_facets(context)['tags'].items())
 
 @fancy_tag(register, takes_context=True)
 def opengraph_meta(context, pid):
@@ -126,16 +138,23 @@ def get_post_comment(context, post):
 
 @register.inclusion_tag('microblog/show_posts_list.html', takes_context=True)
 def show_posts_list(context, posts):
+    # recupero in un colpo solo i dati di tutti i post, verranno usati da
+    # show_post_summary
+    pids = [ p.id for p in posts ]
     ctx = Context(context)
     ctx.update({
         'posts': posts,
+        '_post_data': dict(zip(pids, dataaccess.post_data_many(pids, _lang(context)))),
     })
     return ctx
 
 @register.inclusion_tag('microblog/show_post_summary.html', takes_context=True)
 def show_post_summary(context, post):
     ctx = Context(context)
-    ctx.update(dataaccess.post_data(post.id, _lang(context)))
+    data = context.get('_post_data', {}).get(post.id)
+    if data is None:
+        data = dataaccess.post_data(post.id, _lang(context))
+    ctx.update(data)
     return ctx
 
 @register.inclusion_tag('microblog/show_post_detail.html', takes_context=True)
@@ -180,11 +199,13 @@ def prepare_summary(content):
     Aggiunge al summary il link continua che punta al body del post
     """
     summary = content.summary
-    if not content.body:
+    if not content.has_body:
         return summary
-    data = dataaccess.post_data(content.post_id, content.language)
+    url = getattr(content, 'permalink', None)
+    if url is None:
+        url = dataaccess.post_data(content.post_id, content.language)['url']
     continue_string = ugettext("Continua")
-    link = '<span class="continue"> <a href="%s">%s&nbsp;&rarr;</a></span>' % (data['url'], continue_string)
+    link = '<span class="continue"> <a href="%s">%s&nbsp;&rarr;</a></span>' % (url, continue_string)
     # se il summary contiene del markup cerco di inserire il link dentro il tag
     # più esterno
     match = last_close.search(summary)
@@ -199,7 +220,7 @@ def prepare_summary(content):
 def user_name_for_url(user):
     """
     """
-    return slugify('%s-%s' % (user.first_name, user.last_name))
+    return models.author_slug(user)
 
 @register.inclusion_tag('microblog/show_post_comments.html', takes_context=True)
 def show_post_comments(context, post):
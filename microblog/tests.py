@@ -0,0 +1,238 @@
+# -*- coding: UTF-8 -*-
+from datetime import datetime, timedelta
+
+from django.contrib import comments
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from taggit.models import Tag
+
+from microblog import dataaccess, feeds, models, pagecache, settings
+
+def create_posts(n, lang=settings.MICROBLOG_DEFAULT_LANGUAGE):
+    author = User.objects.create(username='author%d' % n, first_name='A', last_name='B')
+    category = models.Category.objects.create(name='category%d' % n)
+    now = datetime.now()
+    for ix in range(n):
+        post = models.Post.objects.create(
+            author=author,
+            category=category,
+            date=now - timedelta(days=ix),
+            status='P',
+            allow_comments=True)
+        models.PostContent.objects.create(
+            post=post,
+            language=lang,
+            headline='post %d' % ix,
+            slug='post-%d' % ix,
+            summary='summary',
+            body='body')
+        post.tags.add('tag%d' % ix, 'common')
+    return author
+
+@override_settings(DEFAULT_URL_PREFIX='http://example.com')
+class FeedQueriesTest(TestCase):
+    urls = 'microblog.urls'
+
+    def setUp(self):
+        cache.clear()
+
+    def assertFeedQueries(self, n, num):
+        create_posts(n)
+        request = RequestFactory().get('/feeds/latest/')
+        request.user = AnonymousUser()
+        feed = feeds.LatestPosts()
+        # la prima generazione riempie la cache dei Site
+        feed.get_feed(feed.get_object(request), request)
+        cache.clear()
+        with self.assertNumQueries(num):
+            feed.get_feed(feed.get_object(request), request)
+
+    def test_constant_queries(self):
+        # contenuti e tag_map, indipendentemente dal numero di item
+        self.assertFeedQueries(2, 2)
+        models.Post.objects.all().delete()
+        self.assertFeedQueries(8, 2)
+
+    def test_item_categories(self):
+        create_posts(3)
+        request = RequestFactory().get('/feeds/latest/')
+        request.user = AnonymousUser()
+        feed = feeds.LatestPosts()
+        obj = feed.get_object(request)
+        with self.assertNumQueries(0):
+            categories = [ feed.item_categories(item) for item in obj['items'] ]
+        self.assertEqual(categories[0], ['common', 'tag0'])
+
+class PostListTagTest(TestCase):
+    urls = 'microblog.urls'
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, user, source):
+        t = Template('{% load microblog_tags %}' + source)
+        return t.render(Context({
+            'user': user,
+            'LANGUAGE_CODE': settings.MICROBLOG_DEFAULT_LANGUAGE,
+        }))
+
+    def test_count_authenticated(self):
+        # con il filtro di default un utente autenticato non aggiunge
+        # nessuna posting list
+        author = create_posts(4)
+        output = self.render(author, '{% post_list count=2 as posts %}{{ posts|length }}')
+        self.assertEqual(output, '2')
+
+    def test_count_anonymous(self):
+        create_posts(4)
+        output = self.render(AnonymousUser(), '{% post_list count=3 as posts %}{{ posts|length }}')
+        self.assertEqual(output, '3')
+
+    def test_renamed_tag(self):
+        create_posts(2)
+        self.render(AnonymousUser(), '{% post_list tag="common" as posts %}')
+        tag = Tag.objects.get(name='common')
+        tag.name = 'renamed'
+        tag.save()
+        output = self.render(AnonymousUser(), '{% post_list tag="renamed" as posts %}{{ posts|length }}')
+        self.assertEqual(output, '2')
+
+class PostUrlTest(TestCase):
+    urls = 'microblog.urls'
+
+    def test_same_as_reverse(self):
+        args = (datetime(2012, 3, 4), 'news', 'hello-world')
+        name, a, kw = models.PostContent.url_args(*args)
+        self.assertEqual(models.post_url_path(*args), reverse(name, args=a, kwargs=kw))
+
+    def test_permalink_prefix(self):
+        args = (datetime(2012, 3, 4), 'news', 'hello-world')
+        path = models.post_url_path(*args)
+        with self.settings(DEFAULT_URL_PREFIX='http://a.example.com'):
+            self.assertEqual(models.permalink(*args), 'http://a.example.com' + path)
+        with self.settings(DEFAULT_URL_PREFIX='http://b.example.com'):
+            self.assertEqual(models.permalink(*args), 'http://b.example.com' + path)
+
+    def test_invalid_arguments(self):
+        # lo slug non può contenere "/", come con reverse()
+        self.assertRaises(
+            NoReverseMatch,
+            models.post_url_path, datetime(2012, 3, 4), 'news', 'hello/world')
+
+@override_settings(DEFAULT_URL_PREFIX='http://example.com')
+class PostDataRecordsTest(TestCase):
+    urls = 'microblog.urls'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_model_compatible(self):
+        # i template scritti per i modelli devono continuare a funzionare con
+        # i record restituiti da get_post_data
+        create_posts(1)
+        post = models.Post.objects.get()
+        lang = settings.MICROBLOG_DEFAULT_LANGUAGE
+        data = dataaccess.post_data(post.id, lang)
+        self.assertEqual(data['post'].get_absolute_url(), post.get_absolute_url())
+        path = post.content(lang).get_absolute_url()
+        self.assertEqual(data['content'].get_absolute_url(), path)
+        self.assertEqual(data['url'], 'http://example.com' + path)
+        self.assertEqual(
+            sorted(t.get_absolute_url() for t in data['tags']),
+            [ reverse('microblog-tag', args=[n]) for n in ('common', 'tag0') ])
+    def test_comment_users(self):
+        # userinfo dei commenti di utenti registrati non deve richiedere una
+        # query per commento
+        author = create_posts(2)
+        for post in models.Post.objects.all():
+            comments.get_model().objects.create(
+                content_type=ContentType.objects.get_for_model(models.Post),
+                object_pk=str(post.id),
+                site=Site.objects.get_current(),
+                user=author,
+                comment='comment',
+                is_public=True)
+        pids = list(models.Post.objects.values_list('id', flat=True))
+        cache.clear()
+        # post, contenuti, commenti e tag
+        with self.assertNumQueries(4):
+            data = dataaccess.post_data_many(pids, settings.MICROBLOG_DEFAULT_LANGUAGE)
+        self.assertEqual(
+            [ c.user_id for d in data for c in d['comments'] ],
+            [ author.id, author.id ])
+
+class PageCacheInvalidationTest(TestCase):
+    urls = 'microblog.urls'
+
+    def setUp(self):
+        cache.clear()
+        # i segnali vengono collegati da pagecache solo con
+        # MICROBLOG_PAGE_CACHE attivo
+        self.signals = [ (post_save, pagecache.invalidate), (post_delete, pagecache.invalidate) ]
+        self.signals += [ (pre_save, pagecache.stash_paths), (pre_delete, pagecache.stash_paths) ]
+        for signal, handler in self.signals:
+            for m in (models.Post, models.PostContent, comments.get_model()):
+                signal.connect(handler, sender=m, weak=False)
+
+    def tearDown(self):
+        for signal, handler in self.signals:
+            for m in (models.Post, models.PostContent, comments.get_model()):
+                signal.disconnect(handler, sender=m)
+
+    def test_empty_translation(self):
+        create_posts(1)
+        post = models.Post.objects.get()
+        # come fa l'admin per le lingue non tradotte
+        models.PostContent.objects.create(
+            post=post, language='xx', headline='', slug='', summary='', body='')
+        post.save()
+        comments.get_model().objects.create(
+            content_type=ContentType.objects.get_for_model(models.Post),
+            object_pk=str(post.id),
+            site=Site.objects.get_current(),
+            user_name='user',
+            comment='comment',
+            is_public=True)
+        self.assertEqual(len(pagecache._post_paths(post.id)), 1)
+
+class FeedInvalidationTest(TestCase):
+    urls = 'microblog.urls'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tagged_item(self):
+        # il tag di un post invalida solo i feed del tag e quelli della
+        # lingua del post, non tutti i feed
+        create_posts(1)
+        post = models.Post.objects.get()
+        lang = settings.MICROBLOG_DEFAULT_LANGUAGE
+        nss = [
+            dataaccess.FEEDS,
+            dataaccess.feed_namespaces(lang)[1],
+            dataaccess.feed_facet_namespace('tag', 'common'),
+            dataaccess.feed_facet_namespace('tag', 'new'),
+        ]
+        before = dataaccess.generations(nss)
+        post.tags.add('new')
+        after = dataaccess.generations(nss)
+        changed = [ ns for ns in nss if before[ns] != after[ns] ]
+        self.assertEqual(changed, nss[1:2] + nss[3:])
+
+    def test_draft(self):
+        create_posts(1)
+        post = models.Post.objects.get()
+        post.status = 'D'
+        post.save()
+        before = dataaccess.generations([ dataaccess.FEEDS ])
+        post.tags.add('new')
+        self.assertEqual(dataaccess.generations([ dataaccess.FEEDS ]), before)
@@ -7,6 +7,12 @@ urlpatterns = patterns('microblog.views',
         r'^$', 'post_list', name='microblog-full-list'),
     url(
         r'^feeds/latest/?$', feeds.LatestPosts(), name='microblog-feeds-latest',),
+    url(
+        r'^feeds/tags/(?P<tag>[^/]+)/?$', feeds.TagPosts(), name='microblog-feeds-tag',),
+    url(
+        r'^feeds/categories/(?P<category>[^/]+)/?$', feeds.CategoryPosts(), name='microblog-feeds-category',),
+    url(
+        r'^feeds/authors/(?P<author>[^/]+)/?$', feeds.AuthorPosts(), name='microblog-feeds-author',),
     url(
         r'^categories/(?P<category>.*)$', 'category', name='microblog-category',),
     url(
@@ -1,7 +1,57 @@
 # -*- coding: UTF-8 -*-
 from microblog import settings
 
+import threading
+
 def bitly_url(post_content):
     import bitly
     api = bitly.Api(login=settings.MICROBLOG_BITLY_LOGIN, apikey=settings.MICROBLOG_BITLY_APIKEY)
     return api.shorten(post_content.get_url())
+
+class HtmlToText(object):
+    """
+    Convertitore html -> testo (markdown) basato su html2text, con le opzioni
+    specificate per istanza:
+
+        to_text = HtmlToText(ignore_images=True)
+        text = to_text(html)
+
+    Le versioni di html2text che hanno la classe HTML2Text vengono
+    configurate per ogni conversione e possono essere usate da più thread;
+    con quelle più vecchie, che hanno solo opzioni a livello di modulo, la
+    conversione avviene sotto un lock e le opzioni globali vengono
+    ripristinate al termine.
+    """
+    # opzione -> (attributo di HTML2Text, variabile globale di html2text)
+    OPTIONS = {
+        'ignore_images': ('ignore_images', 'IGNORE_IMAGES'),
+        'ignore_links': ('ignore_links', 'IGNORE_ANCHORS'),
+        'body_width': ('body_width', 'BODY_WIDTH'),
+    }
+    _lock = threading.Lock()
+
+    def __init__(self, **options):
+        for k in options:
+            if k not in self.OPTIONS:
+                raise TypeError('unknown option: %s' % k)
+        self.options = options
+
+    def __call__(self, html):
+        import html2text
+        if hasattr(html2text, 'HTML2Text'):
+            # un'istanza di HTML2Text accumula lo stato della conversione,
+            # non può essere condivisa
+            h = html2text.HTML2Text()
+            for k, v in self.options.items():
+                setattr(h, self.OPTIONS[k][0], v)
+            return h.handle(html)
+        with self._lock:
+            names = [ self.OPTIONS[k][1] for k in self.options ]
+            old = dict((n, getattr(html2text, n)) for n in names)
+            try:
+                for k, v in self.options.items():
+                    setattr(html2text, self.OPTIONS[k][1], v)
+                return html2text.html2text(html)
+            finally:
+                for n, v in old.items():
+                    setattr(html2text, n, v)
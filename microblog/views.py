@@ -1,13 +1,12 @@
 # -*- coding: UTF-8 -*-
 from django.conf import settings as dsettings
-from django.contrib.auth import models as authModels
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.http import HttpResponse, Http404
 from django.shortcuts import render, render_to_response, get_object_or_404
 from django.template import RequestContext
-from django.template.defaultfilters import slugify
 
-from microblog import models, settings
+from microblog import dataaccess, models, pagecache, settings
+from microblog.pagecache import conditional, page_cache
 
 from taggit.models import Tag, TaggedItem
 from decorator import decorator
@@ -42,9 +41,16 @@ def render_json(f):
         return HttpResponse(content=result, content_type=ct, status=status)
     return decorator(wrapper, f)
 
+@conditional()
+@page_cache(pagecache.lists)
 def post_list(request):
-    return render(request, 'microblog/post_list.html', {})
+    ctx = {}
+    if settings.MICROBLOG_POST_LIST_PAGINATION:
+        ctx['page'] = _keyset_page(request)
+    return render(request, 'microblog/post_list.html', ctx)
 
+@conditional()
+@page_cache(pagecache.lists)
 def category(request, category):
     category = get_object_or_404(models.Category, name=category)
     return render_to_response(
@@ -55,6 +61,8 @@ def category(request, category):
         context_instance=RequestContext(request)
     )
 
+@conditional()
+@page_cache(pagecache.lists)
 def post_list_by_year(request, year, month=None):
     return render_to_response(
         'microblog/list_by_year.html',
@@ -65,6 +73,8 @@ def post_list_by_year(request, year, month=None):
         context_instance=RequestContext(request)
     )
 
+@conditional()
+@page_cache(pagecache.lists)
 def tag(request, tag):
     tag = get_object_or_404(Tag, name=tag)
     return render_to_response(
@@ -75,15 +85,12 @@ def tag(request, tag):
         context_instance=RequestContext(request)
     )
 
+@conditional()
+@page_cache(pagecache.lists)
 def author(request, author):
-    user = [
-        u for u in authModels.User.objects.all()
-        if slugify('%s-%s' % (u.first_name, u.last_name)) == author
-    ]
+    user = dataaccess.author_by_slug(author)
     if not user:
         raise Http404()
-    else:
-        user = user[0]
 
     return render_to_response(
         'microblog/author.html',
@@ -111,6 +118,30 @@ def _paginate_posts(post_list, request):
 
     return posts
 
+def _keyset_page(request):
+    """
+    Restituisce la pagina di post (vedi dataaccess.post_page) individuata
+    dal parametro "before" della richiesta.
+    """
+    lang = request.LANGUAGE_CODE.split('-', 1)[0]
+    cursor = request.GET.get('before') or None
+    if cursor is not None:
+        try:
+            dataaccess.decode_cursor(cursor)
+        except ValueError:
+            cursor = None
+    user = request.user
+    default_filter = settings.MICROBLOG_POST_FILTER is settings.default_post_filter
+    if default_filter and not user.is_authenticated():
+        visibility = 'public'
+    else:
+        visibility = 'all'
+    page = dataaccess.post_page(lang, visibility, cursor, settings.MICROBLOG_POST_PER_PAGE)
+    if not default_filter:
+        # con un filtro personalizzato la pagina può risultare più corta
+        page = dict(page, posts=settings.MICROBLOG_POST_FILTER(page['posts'], user))
+    return page
+
 def _posts_list(request, featured=False):
     if settings.MICROBLOG_LANGUAGE_FALLBACK_ON_POST_LIST:
         lang = None
@@ -213,6 +244,8 @@ if settings.MICROBLOG_URL_STYLE == 'date':
         return models.PostContent.objects\
             .select_related('post')\
             .getBySlugAndDate(slug, year, month, day)
+    @conditional(pagecache.any_language)
+    @page_cache(pagecache.detail)
     @_post404
     def post_detail(request, year, month, day, slug):
         return _post_detail(
@@ -238,6 +271,8 @@ elif settings.MICROBLOG_URL_STYLE == 'category':
         return models.PostContent.objects\
             .select_related('post')\
             .getBySlugAndCategory(slug, category)
+    @conditional(pagecache.any_language)
+    @page_cache(pagecache.detail)
     @_post404
     def post_detail(request, category, slug):
         return _post_detail(